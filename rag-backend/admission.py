@@ -0,0 +1,178 @@
+"""
+Qbit RAG Backend - Admission Control
+Overload protection for calls to Ollama.
+
+AdmissionController caps how many LLM calls run at once and how many may wait
+for a slot. A request whose expected (or actual) wait exceeds the queue
+budget is shed straight away so the caller can answer with a fallback instead
+of timing out. CircuitBreaker stops calling an Ollama that keeps failing and
+lets a single probe through once the cool-down has passed.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Unavailable(Exception):
+    """Raised when an LLM call is refused before reaching Ollama."""
+
+
+class Overloaded(Unavailable):
+    """The call was shed because the LLM queue is full or too slow."""
+
+
+class CircuitOpen(Unavailable):
+    """The call was refused because Ollama is failing."""
+
+
+class AdmissionController:
+    """Bounded in-flight limit with a bounded, time-limited wait queue."""
+
+    # Smoothing factor for the moving average of call durations
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, max_in_flight=4, max_queue=16, max_queue_wait=5.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.avg_service_time = 0.0
+
+    def estimated_wait(self):
+        """Expected queueing delay for a new arrival, from recent call durations."""
+        if self.in_flight < self.max_in_flight:
+            return 0.0
+        return (self.queued + 1) * self.avg_service_time / self.max_in_flight
+
+    def _shed(self, reason):
+        self.shed += 1
+        raise Overloaded(reason)
+
+    @contextmanager
+    def admit(self):
+        """Hold an LLM slot for the duration of the block, or raise Overloaded."""
+        with self._cond:
+            if self.in_flight >= self.max_in_flight:
+                if self.queued >= self.max_queue:
+                    self._shed("LLM queue full")
+                if self.estimated_wait() > self.max_queue_wait:
+                    self._shed("LLM queue wait would exceed budget")
+
+                self.queued += 1
+                deadline = time.monotonic() + self.max_queue_wait
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._shed("LLM queue wait exceeded budget")
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+
+            self.in_flight += 1
+            self.admitted += 1
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self.in_flight -= 1
+                if self.avg_service_time:
+                    self.avg_service_time += self.EWMA_ALPHA * (elapsed - self.avg_service_time)
+                else:
+                    self.avg_service_time = elapsed
+                self._cond.notify()
+
+    def resize(self, max_in_flight):
+        """Change the in-flight limit, waking waiters if it grew."""
+        with self._cond:
+            self.max_in_flight = max_in_flight
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": self.queued,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "avg_service_time": round(self.avg_service_time, 3)
+            }
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open probe -> closed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.trips = 0
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go through right now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+            raise CircuitOpen("Ollama circuit breaker is open")
+
+    def allows_call(self):
+        """Whether before_call would let a call through now, without taking a probe slot."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return self.state == self.CLOSED or not self._probe_in_flight
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Give back a half-open probe slot whose call ended without a verdict."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "trips": self.trips,
+                "rejected": self.rejected
+            }
@@ -0,0 +1,134 @@
+"""
+Qbit RAG Backend - Answer Cache
+In-process LRU + TTL cache of generated chat answers.
+
+Answers are keyed on the normalized question plus the id and content version
+of every document retrieval returned for it. Editing a knowledge base entry
+changes its version, so answers built from the old text are never served
+again; they simply age out. Memory use is bounded by both entry count and an
+approximate byte budget.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Rough per-entry bookkeeping cost on top of the answer text itself
+_ENTRY_OVERHEAD = 256
+
+
+def normalize_message(message):
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return " ".join(_WORD_RE.findall(message.lower()))
+
+
+def document_version(doc):
+    """Short content hash identifying one revision of a document."""
+    digest = hashlib.blake2b(digest_size=8)
+    for field in ('content', 'source', 'category'):
+        digest.update(doc.get(field, '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """Thread-safe LRU cache with per-entry TTL and a memory bound."""
+
+    def __init__(self, max_entries=1024, ttl=3600.0, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, answer)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(message, docs):
+        """Build a cache key from the question and the retrieved documents."""
+        return (
+            normalize_message(message),
+            tuple((doc['id'], document_version(doc)) for doc in docs)
+        )
+
+    def get(self, key):
+        """Return the cached answer or None, counting the hit or miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, answer = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key, answer):
+        """Store an answer, evicting least recently used entries as needed."""
+        size = len(answer.encode('utf-8')) + len(key[0]) + _ENTRY_OVERHEAD
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, answer)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate_documents(self, doc_ids):
+        """Drop every answer that was built from any of the given documents."""
+        doc_ids = set(doc_ids)
+        with self._lock:
+            stale = [key for key in self._entries
+                     if any(doc_id in doc_ids for doc_id, _ in key[1])]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def create_answer_cache():
+    """Build the answer cache from config (max_entries=0 disables it)."""
+    return AnswerCache(
+        max_entries=config.ANSWER_CACHE_SIZE,
+        ttl=config.ANSWER_CACHE_TTL,
+        max_bytes=config.ANSWER_CACHE_MAX_BYTES
+    )
@@ -0,0 +1,149 @@
+"""
+Qbit RAG Backend - Batch Queries
+Parsing and bounded fan-out for /api/chat/batch.
+
+A batch is a JSON array of messages or an object {"messages": [...], ...}
+with options, parsed whole by parse_batch, or NDJSON with one message per
+line, parsed by iter_ndjson as the upload arrives. A message is a string or
+an object with a "message" and optionally an "id" that is echoed back.
+Retrieval runs for each parsed group of messages in one call (the whole
+batch for JSON, each received group of lines for NDJSON), then messages
+that need the LLM are fanned out to the worker pool a few at a time and
+each result is streamed back as an NDJSON line, tagged with its input
+index, as soon as it is ready.
+
+Modes:
+    full        answer like /api/chat (extractive, cached or generated)
+    retrieval   only the retrieved documents and their scores
+    extractive  only the extractive answer, null when none is confident
+"""
+
+import json
+from concurrent.futures import FIRST_COMPLETED, wait
+
+MODES = ('full', 'retrieval', 'extractive')
+
+
+class BatchItem:
+    """One message of a batch."""
+
+    __slots__ = ('index', 'message', 'item_id')
+
+    def __init__(self, index, message, item_id=None):
+        self.index = index
+        self.message = message
+        self.item_id = item_id
+
+    def tag(self, payload):
+        """Add the index (and id, if given) a result line is reported under."""
+        payload = dict(payload, index=self.index)
+        if self.item_id is not None:
+            payload['id'] = self.item_id
+        return payload
+
+
+def _item(index, entry):
+    if isinstance(entry, str):
+        return BatchItem(index, entry)
+    if isinstance(entry, dict) and isinstance(entry.get('message'), str):
+        return BatchItem(index, entry['message'], entry.get('id'))
+    raise ValueError(f"Message {index} must be a string or an object with a \"message\" string")
+
+
+def batch_options(options):
+    """Validate and normalize batch options (mode, threshold)."""
+    options = dict(options or {})
+    mode = options.get('mode', 'full')
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode} (expected one of {', '.join(MODES)})")
+    options['mode'] = mode
+    if options.get('threshold') is not None:
+        threshold = float(options['threshold'])
+        if not 0.0 <= threshold <= 1.0:
+            raise ValueError("threshold must be between 0 and 1")
+        options['threshold'] = threshold
+    return options
+
+
+def parse_batch(body, options=None, max_items=1000):
+    """Return (items, options) for a JSON batch request body (NDJSON goes
+    through iter_ndjson).
+
+    options holds the query-string options; a JSON object body can add its
+    own, which take precedence.
+    """
+    options = dict(options or {})
+    data = json.loads(body.decode('utf-8'))
+    if isinstance(data, dict):
+        entries = data.get('messages')
+        options.update((key, value) for key, value in data.items() if key != 'messages')
+    else:
+        entries = data
+    if not isinstance(entries, list):
+        raise ValueError("Expected a list of messages")
+    if not entries:
+        raise ValueError("Expected at least one message")
+    if len(entries) > max_items:
+        raise ValueError(f"At most {max_items} messages per batch")
+    return [_item(index, entry) for index, entry in enumerate(entries)], batch_options(options)
+
+
+def iter_ndjson(chunks, max_items=1000):
+    """Parse NDJSON messages from body chunks as they arrive.
+
+    Yields (items, errors) for the complete lines of each chunk, errors
+    being (index, message) for lines that aren't a valid message, so one
+    bad line doesn't fail the rest of the batch. Raises ValueError past
+    max_items messages.
+    """
+    index = 0
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        batch = _parse_lines(lines, index, max_items)
+        index += len(batch[0]) + len(batch[1])
+        if batch[0] or batch[1]:
+            yield batch
+    batch = _parse_lines([pending], index, max_items)
+    if batch[0] or batch[1]:
+        yield batch
+
+
+def _parse_lines(lines, index, max_items):
+    items = []
+    errors = []
+    for line in lines:
+        if not line.strip():
+            continue
+        if index >= max_items:
+            raise ValueError(f"At most {max_items} messages per batch")
+        try:
+            items.append(_item(index, json.loads(line)))
+        except ValueError as e:
+            errors.append((index, str(e)))
+        index += 1
+    return items, errors
+
+
+def run_bounded(submit, func, items, limit):
+    """Yield (item, future) as func(item) finishes, with at most limit
+    running at once. submit(func, item) schedules a call and returns its
+    Future. Calls not started yet are cancelled if the caller stops early."""
+    pending = iter(items)
+    running = {}
+    try:
+        for item in pending:
+            running[submit(func, item)] = item
+            if len(running) >= limit:
+                break
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future
+                for item in pending:
+                    running[submit(func, item)] = item
+                    break
+    finally:
+        for future in running:
+            future.cancel()
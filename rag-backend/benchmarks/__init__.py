@@ -0,0 +1,8 @@
+"""
+Qbit RAG Backend - Benchmarks
+Load tests and micro-benchmarks. Run from rag-backend/, e.g.:
+
+    python3 -m benchmarks.ollama_stub --port 11434 --latency 0.5
+    python3 -m benchmarks.load_test --concurrency 16 --duration 30
+    python3 -m benchmarks.micro_bench --sizes 10,1000,100000
+"""
@@ -0,0 +1,74 @@
+"""Shared helpers for benchmark scripts: percentiles and JSON result files."""
+
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies):
+    """Count, mean and p50/p95/p99/max of a list of latencies in seconds, reported in ms."""
+    values = sorted(latencies)
+    if not values:
+        return {"count": 0}
+    to_ms = 1000.0
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * to_ms, 4),
+        "p50_ms": round(percentile(values, 50) * to_ms, 4),
+        "p95_ms": round(percentile(values, 95) * to_ms, 4),
+        "p99_ms": round(percentile(values, 99) * to_ms, 4),
+        "max_ms": round(values[-1] * to_ms, 4)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(benchmark, parameters, results, output=None):
+    """Emit a benchmark run as JSON, to a file or stdout, with run metadata."""
+    document = {
+        "benchmark": benchmark,
+        "timestamp": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": parameters,
+        "results": results
+    }
+    text = json.dumps(document, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + "\n")
+        print(f"📊 Results written to {output}", file=sys.stderr)
+    else:
+        print(text)
+    return document
+
+
+class Timer:
+    """Context manager measuring elapsed wall-clock seconds."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        return False
@@ -0,0 +1,241 @@
+"""
+Load generator for the Qbit RAG backend.
+
+Drives /api/chat, /api/newsletters, /api/knowledge and /health with a
+weighted request mix at fixed concurrency, then reports throughput and
+latency percentiles per endpoint as JSON.
+
+    python3 -m benchmarks.load_test --url http://localhost:8080 --concurrency 16 --duration 30 \\
+        --mix chat=6,knowledge=2,health=1,newsletters=1 --output results.json
+
+With --turns N each worker holds a conversation for N chats, sending back
+the conversation_id so follow-ups reuse the session's Ollama context.
+
+Use --with-stub to also start a local Ollama stub (see ollama_stub.py); the
+backend must then be started with OLLAMA_HOST pointing at --stub-port.
+"""
+
+import argparse
+import http.client
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+from benchmarks.common import summarize, write_results
+from benchmarks.ollama_stub import start_stub
+
+SAMPLE_QUESTIONS = [
+    "What is my total annual leave number?",
+    "Can I work from home 5 days a week?",
+    "How much does the company pay for health insurance?",
+    "What's the process for getting IT support?",
+    "Do I have any active tickets?",
+    "How many sick days do I get?",
+    "What's the 401k match?",
+    "When are performance reviews?",
+    "What is the dental coverage?",
+    "How much is the home office reimbursement?"
+]
+
+_ANSWERED_BY_RE = re.compile(rb'"answered_by": "(\w+)"')
+_CONVERSATION_ID_RE = re.compile(rb'"conversation_id": "([^"]+)"')
+
+ENDPOINTS = {
+    "chat": ("POST", "/api/chat"),
+    "newsletters": ("POST", "/api/newsletters"),
+    "knowledge": ("GET", "/api/knowledge"),
+    "health": ("GET", "/health")
+}
+
+
+def parse_mix(text):
+    """Parse 'chat=6,health=1' into [(endpoint, weight), ...]."""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}', expected one of {', '.join(ENDPOINTS)}")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+class LoadTest:
+    """Closed-loop load: each worker sends its next request as soon as the last finishes."""
+
+    def __init__(self, url, concurrency, duration=None, total_requests=None, mix=None,
+                 stream=False, unique_messages=False, turns=1, timeout=60.0, seed=0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total_requests = total_requests
+        self.mix = mix or [("chat", 1.0)]
+        self.stream = stream
+        self.unique_messages = unique_messages
+        self.turns = turns
+        self.timeout = timeout
+        self.seed = seed
+        self.samples = []  # (endpoint, latency, first_byte, status, answered_by)
+        self._lock = threading.Lock()
+        self._issued = 0
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def _next_ticket(self):
+        with self._lock:
+            if self.total_requests is not None and self._issued >= self.total_requests:
+                return False
+            self._issued += 1
+            return True
+
+    def _body(self, endpoint, rng, sequence, conversation_id=None):
+        if endpoint == "chat":
+            message = rng.choice(SAMPLE_QUESTIONS)
+            if self.unique_messages:
+                message = f"{message} (run {self.run_id} request {sequence})"
+            payload = {"message": message}
+            if conversation_id is not None:
+                payload["conversation_id"] = conversation_id
+            if self.stream:
+                payload["stream"] = True
+            return json.dumps(payload)
+        if endpoint == "newsletters":
+            return json.dumps({"count": 2})
+        return None
+
+    def _send(self, connection, endpoint, body):
+        method, path = ENDPOINTS[endpoint]
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        started = time.perf_counter()
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        first_chunk = response.read(1)
+        first_byte = time.perf_counter() - started
+        rest = response.read()
+        latency = time.perf_counter() - started
+        if response.will_close:
+            connection.close()
+        body = first_chunk + rest
+        answered_by = _ANSWERED_BY_RE.findall(body) if endpoint == "chat" else None
+        conversation_id = _CONVERSATION_ID_RE.search(body) if endpoint == "chat" else None
+        return (latency, first_byte if first_chunk else latency, response.status,
+                answered_by[-1].decode() if answered_by else None,
+                conversation_id.group(1).decode() if conversation_id else None)
+
+    def _worker(self, worker_id, deadline):
+        rng = random.Random(self.seed + worker_id)
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        sequence = 0
+        conversation_id = None
+        turn = 0
+
+        while (deadline is None or time.perf_counter() < deadline) and self._next_ticket():
+            endpoint = rng.choices(names, weights)[0]
+            sequence += 1
+            if endpoint == "chat":
+                if turn >= self.turns:
+                    conversation_id, turn = None, 0
+                turn += 1
+            try:
+                latency, first_byte, status, answered_by, replied_id = self._send(
+                    connection, endpoint,
+                    self._body(endpoint, rng, f"{worker_id}-{sequence}", conversation_id))
+                if endpoint == "chat" and self.turns > 1:
+                    conversation_id = replied_id
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                latency, first_byte, status, answered_by = None, None, 0, None
+            with self._lock:
+                self.samples.append((endpoint, latency, first_byte, status, answered_by))
+        connection.close()
+
+    def run(self):
+        deadline = time.perf_counter() + self.duration if self.duration else None
+        started = time.perf_counter()
+        workers = [threading.Thread(target=self._worker, args=(i, deadline)) for i in range(self.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        results = {"elapsed_s": round(elapsed, 3), "endpoints": {}}
+        by_endpoint = {}
+        answered_by = {}
+        for endpoint, latency, first_byte, status, path in self.samples:
+            by_endpoint.setdefault(endpoint, []).append((latency, first_byte, status))
+            if path is not None:
+                answered_by[path] = answered_by.get(path, 0) + 1
+
+        total_ok = 0
+        for endpoint, samples in sorted(by_endpoint.items()):
+            ok = [(latency, first_byte) for latency, first_byte, status in samples if 200 <= status < 300]
+            total_ok += len(ok)
+            results["endpoints"][endpoint] = {
+                "requests": len(samples),
+                "errors": len(samples) - len(ok),
+                "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+                "latency": summarize([latency for latency, _ in ok]),
+                "time_to_first_byte": summarize([first_byte for _, first_byte in ok])
+            }
+        if answered_by:
+            results["endpoints"]["chat"]["answered_by"] = answered_by
+
+        results["total_requests"] = len(self.samples)
+        results["total_errors"] = len(self.samples) - total_ok
+        results["throughput_rps"] = round(total_ok / elapsed, 3) if elapsed else 0.0
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Qbit RAG backend")
+    parser.add_argument('--url', default="http://localhost:8080")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to run (ignored with --requests)")
+    parser.add_argument('--requests', type=int, default=None, help="stop after this many requests")
+    parser.add_argument('--mix', default="chat=6,knowledge=2,health=1,newsletters=1",
+                        help="weighted endpoint mix, e.g. chat=6,health=1")
+    parser.add_argument('--stream', action='store_true', help="request streaming chat responses")
+    parser.add_argument('--unique-messages', action='store_true',
+                        help="make every chat message unique so answer caching can't help")
+    parser.add_argument('--turns', type=int, default=1,
+                        help="chats per conversation before starting a new one")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--with-stub', action='store_true', help="start a local Ollama stub for the run")
+    parser.add_argument('--stub-port', type=int, default=11434)
+    parser.add_argument('--stub-latency', type=float, default=0.5)
+    parser.add_argument('--stub-tokens-per-second', type=float, default=30.0)
+    parser.add_argument('--stub-prefill-tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--output', help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    stub = None
+    if args.with_stub:
+        stub = start_stub(args.stub_port, latency=args.stub_latency,
+                          tokens_per_second=args.stub_tokens_per_second,
+                          prefill_tokens_per_second=args.stub_prefill_tokens_per_second)
+
+    test = LoadTest(args.url, args.concurrency,
+                    duration=None if args.requests else args.duration,
+                    total_requests=args.requests, mix=parse_mix(args.mix),
+                    stream=args.stream, unique_messages=args.unique_messages, turns=args.turns,
+                    timeout=args.timeout, seed=args.seed)
+    results = test.run()
+
+    if stub is not None:
+        stub.shutdown()
+
+    write_results("load_test", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    main()
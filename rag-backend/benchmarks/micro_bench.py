@@ -0,0 +1,162 @@
+"""
+Micro-benchmarks for retrieval and newsletter parsing.
+
+Builds synthetic knowledge bases of increasing size from the vocabulary of
+the real one and times index construction, search_documents-style queries
+(SearchIndex.search, which search_documents delegates to), dense
+matrix-vector search (exact and IVF, when NumPy is installed), incremental
+index updates for a single changed document and parse_newsletter_response. Results are emitted as JSON.
+
+    python3 -m benchmarks.micro_bench --sizes 10,100,1000,10000,100000 --output micro.json
+"""
+
+import argparse
+import random
+import re
+
+from benchmarks.common import Timer, summarize, write_results
+from benchmarks.load_test import SAMPLE_QUESTIONS
+from dense import DenseIndex, HashingEmbedder
+from newsletters import parse_newsletter_response
+from ollama_rag import KNOWLEDGE_BASE
+from retrieval import SearchIndex
+
+SAMPLE_NEWSLETTER_OUTPUTS = [
+    "Title: Agentic AI Reshapes Developer Workflows\nDescription: Coding agents now handle reviews, tests and refactors end to end.",
+    "**Title:** \"Scan Compression Cuts DFT Test Time\"\n**Description:** New EDT schemes shrink pattern counts by 40% on 3nm designs.",
+    "Here is your newsletter entry:\n\ntitle - Rust in the Kernel\ndescription - Memory-safe drivers land upstream with broad vendor support.",
+    "I'm sorry, I can't browse the web, but AI and software trends this year include copilots and LLM evaluation."
+]
+
+
+def synthetic_knowledge_base(size, seed=0, words_per_doc=60, filler_vocabulary=5000):
+    """Generate size documents mixing real policy sentences with Zipf-distributed filler terms."""
+    rng = random.Random(seed)
+    sentences = []
+    categories = []
+    for doc in KNOWLEDGE_BASE.values():
+        sentences.extend(s.strip() for s in re.split(r'(?<=[.|])\s+', doc['content']) if s.strip())
+        categories.append(doc['category'])
+
+    filler = [f"term{i}" for i in range(filler_vocabulary)]
+    filler_weights = [1.0 / (rank + 1) for rank in range(filler_vocabulary)]
+
+    documents = {}
+    for i in range(size):
+        text = rng.sample(sentences, 2)
+        text.append(" ".join(rng.choices(filler, filler_weights, k=words_per_doc)))
+        documents[f"doc_{i}"] = {
+            "content": " ".join(text),
+            "source": f"Synthetic_{i % 97}.pdf",
+            "category": rng.choice(categories)
+        }
+    return documents
+
+
+def bench_search(sizes, iterations, seed):
+    results = {}
+    for size in sizes:
+        documents = synthetic_knowledge_base(size, seed)
+        with Timer() as build:
+            index = SearchIndex.build(documents)
+
+        latencies = []
+        for _ in range(iterations):
+            for query in SAMPLE_QUESTIONS:
+                with Timer() as t:
+                    index.search(query, k=3)
+                latencies.append(t.elapsed)
+
+        results[str(size)] = {
+            "documents": size,
+            "terms": len(index.postings),
+            "build_s": round(build.elapsed, 4),
+            "search": summarize(latencies)
+        }
+        print(f"🔍 {size} docs: build {build.elapsed:.3f}s, "
+              f"p50 {results[str(size)]['search']['p50_ms']}ms", flush=True)
+    return results
+
+
+def bench_dense(sizes, iterations, seed, ivf_lists):
+    """Time exact and IVF dense search over hashed embeddings of the synthetic corpora."""
+    embedder = HashingEmbedder()
+    queries = embedder.embed(SAMPLE_QUESTIONS)
+    results = {}
+    for size in sizes:
+        documents = synthetic_knowledge_base(size, seed)
+        with Timer() as embed:
+            matrix = embedder.embed([doc['content'] for doc in documents.values()])
+        result = {"documents": size, "embed_s": round(embed.elapsed, 4)}
+
+        variants = [("exact", 0)]
+        if ivf_lists and size > ivf_lists:
+            variants.append(("ivf", ivf_lists))
+        for name, lists in variants:
+            with Timer() as build:
+                index = DenseIndex.build(matrix, lists)
+            latencies = []
+            for _ in range(iterations):
+                for query in queries:
+                    with Timer() as t:
+                        index.search(query, 3)
+                    latencies.append(t.elapsed)
+            result[name] = {"build_s": round(build.elapsed, 4), "search": summarize(latencies)}
+
+        results[str(size)] = result
+        print(f"🧭 {size} docs: exact p50 {result['exact']['search']['p50_ms']}ms"
+              + (f", ivf p50 {result['ivf']['search']['p50_ms']}ms" if 'ivf' in result else ""), flush=True)
+    return results
+
+
+def bench_update(sizes, iterations, seed):
+    """Time SearchIndex.updated() for one changed document against a full rebuild."""
+    results = {}
+    for size in sizes:
+        documents = synthetic_knowledge_base(size, seed)
+        with Timer() as build:
+            index = SearchIndex.build(documents)
+        replacement = synthetic_knowledge_base(1, seed + 1)["doc_0"]
+        latencies = []
+        for i in range(iterations):
+            with Timer() as t:
+                index.updated({f"doc_{i % size}": replacement})
+            latencies.append(t.elapsed)
+        results[str(size)] = {"full_build_s": round(build.elapsed, 4), "update": summarize(latencies)}
+        print(f"🔄 {size} docs: update p50 {results[str(size)]['update']['p50_ms']}ms "
+              f"vs full build {build.elapsed * 1000:.1f}ms", flush=True)
+    return results
+
+
+def bench_parse_newsletter(iterations):
+    latencies = []
+    for _ in range(iterations):
+        for output in SAMPLE_NEWSLETTER_OUTPUTS:
+            with Timer() as t:
+                parse_newsletter_response(output, "AI & Software Engineering")
+            latencies.append(t.elapsed)
+    return summarize(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for search and newsletter parsing")
+    parser.add_argument('--sizes', default="10,100,1000,10000,100000",
+                        help="comma-separated synthetic knowledge base sizes")
+    parser.add_argument('--iterations', type=int, default=50, help="passes over the sample queries per size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ivf-lists', type=int, default=256, help="IVF lists for the approximate dense variant")
+    parser.add_argument('--output', help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    results = {
+        "search_documents": bench_search(sizes, args.iterations, args.seed),
+        "dense_search": bench_dense(sizes, args.iterations, args.seed, args.ivf_lists),
+        "incremental_update": bench_update(sizes, args.iterations, args.seed),
+        "parse_newsletter_response": bench_parse_newsletter(args.iterations * 20)
+    }
+    write_results("micro_bench", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Local stand-in for Ollama's HTTP API.
+
+Serves /api/generate (streaming and non-streaming), /api/embed and /api/tags
+with a configurable prefill latency and token rate, so load tests exercise the
+backend without a real model. Point the backend at it with OLLAMA_HOST.
+--prefill-tokens-per-second adds prompt-length dependent prefill time, and a
+request passing back a `context` only pays for its new prompt tokens.
+
+    python3 -m benchmarks.ollama_stub --port 11434 --latency 0.5 --tokens-per-second 30
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("Employees receive 25 days of annual leave and 10 sick days per year "
+         "with up to 5 days carried over to the next year").split()
+
+EMBED_DIM = 256
+
+
+def stub_embedding(text):
+    """Deterministic bag-of-words vector, so similar texts get similar embeddings."""
+    vector = [0.0] * EMBED_DIM
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        vector[zlib.crc32(word.encode()) % EMBED_DIM] += 1.0
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+class StubConfig:
+    """Behaviour knobs shared by all stub request handlers."""
+
+    def __init__(self, latency=0.5, tokens_per_second=30.0, tokens=40, jitter=0.0, error_rate=0.0,
+                 prefill_tokens_per_second=0.0):
+        self.latency = latency  # Seconds before the first token (prefill)
+        self.prefill_tokens_per_second = prefill_tokens_per_second  # 0 = prompt length doesn't matter
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens  # Tokens per completion
+        self.jitter = jitter  # +/- fraction applied to latency
+        self.error_rate = error_rate  # Fraction of calls answered with HTTP 500
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    stub = StubConfig()
+    calls = 0
+    calls_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self.send_json(200, {"models": [{"name": "llama3.1:8b"}]})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        with self.calls_lock:
+            type(self).calls += 1
+
+        if self.path == '/api/embed':
+            texts = request.get('input', [])
+            texts = [texts] if isinstance(texts, str) else texts
+            self.send_json(200, {"model": request.get('model'), "embeddings": [stub_embedding(t) for t in texts]})
+            return
+        if self.path != '/api/generate':
+            self.send_json(404, {"error": "not found"})
+            return
+
+        stub = self.stub
+        if stub.error_rate and random.random() < stub.error_rate:
+            self.send_json(500, {"error": "stub failure"})
+            return
+
+        latency = stub.latency * (1 + random.uniform(-stub.jitter, stub.jitter))
+        prompt_tokens = max(1, len(request.get('prompt', '')) // 4)
+        if stub.prefill_tokens_per_second > 0:
+            latency += prompt_tokens / stub.prefill_tokens_per_second
+        context = list(request.get('context') or [])
+        token_interval = 1.0 / stub.tokens_per_second if stub.tokens_per_second > 0 else 0.0
+        tokens = [(" " if i else "") + WORDS[i % len(WORDS)] for i in range(stub.tokens)]
+
+        started = time.perf_counter()
+        time.sleep(max(latency, 0.0))
+        prefill_done = time.perf_counter()
+
+        def final_chunk():
+            now = time.perf_counter()
+            return {
+                "model": request.get('model', 'llama3.1:8b'),
+                "response": "",
+                "done": True,
+                "context": context + list(range(prompt_tokens + stub.tokens)),
+                "total_duration": int((now - started) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int((prefill_done - started) * 1e9),
+                "eval_count": stub.tokens,
+                "eval_duration": int((now - prefill_done) * 1e9)
+            }
+
+        if request.get('stream', True):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def write_chunk(payload):
+                data = (json.dumps(payload) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            for token in tokens:
+                write_chunk({"response": token, "done": False})
+                time.sleep(token_interval)
+            write_chunk(final_chunk())
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(token_interval * stub.tokens)
+            result = final_chunk()
+            result["response"] = "".join(tokens)
+            self.send_json(200, result)
+
+
+def make_stub_server(port=0, **stub_options):
+    """Create a stub server with its own StubConfig (port 0 picks a free port)."""
+    handler = type('ConfiguredOllamaStubHandler', (OllamaStubHandler,), {"stub": StubConfig(**stub_options)})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_stub(port=0, **stub_options):
+    """Start the stub on a background thread; returns the server (see server_address)."""
+    server = make_stub_server(port, **stub_options)
+    threading.Thread(target=server.serve_forever, name='ollama-stub', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Ollama stand-in for benchmarks")
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency', type=float, default=0.5, help="prefill seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=30.0)
+    parser.add_argument('--tokens', type=int, default=40, help="tokens per completion")
+    parser.add_argument('--jitter', type=float, default=0.0, help="+/- fraction applied to latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of calls that return HTTP 500")
+    parser.add_argument('--prefill-tokens-per-second', type=float, default=0.0,
+                        help="also spend prompt tokens / rate seconds on prefill (0 disables)")
+    args = parser.parse_args()
+
+    server = make_stub_server(args.port, latency=args.latency, tokens_per_second=args.tokens_per_second,
+                              tokens=args.tokens, jitter=args.jitter, error_rate=args.error_rate,
+                              prefill_tokens_per_second=args.prefill_tokens_per_second)
+    print(f"🧪 Ollama stub on http://127.0.0.1:{args.port} "
+          f"(latency {args.latency}s, {args.tokens_per_second} tok/s, {args.tokens} tokens)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
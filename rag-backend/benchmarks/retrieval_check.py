@@ -0,0 +1,64 @@
+"""
+Retrieval regression check for common HR questions.
+
+Each question must still rank the document the original keyword scan found
+for it first, so changes to tokenization, synonyms or scoring can't silently
+lose answers (e.g. plural folding turning "bonus" into "bonu"). Exits with
+status 1 and lists the misses if any question regresses.
+
+    python3 -m benchmarks.retrieval_check
+"""
+
+import sys
+
+from ollama_rag import KNOWLEDGE_BASE
+from retrieval import SearchIndex
+
+# Question -> document the baseline keyword scan returned for it
+EXPECTED = {
+    "bonus": "compensation",
+    "how big is the bonus": "compensation",
+    "what bonuses do we get": "compensation",
+    "How many vacation days do I get?": "leave_policy",
+    "annual leave": "leave_policy",
+    "sick leave": "leave_policy",
+    "maternity leave": "leave_policy",
+    "dental coverage": "health_benefits",
+    "medical insurance": "health_benefits",
+    "vision benefits": "health_benefits",
+    "reset my password": "it_support",
+    "vpn access": "it_support",
+    "it support email": "it_support",
+    "work from home policy": "remote_work",
+    "remote work equipment": "remote_work",
+    "home office reimbursement": "remote_work",
+    "performance review": "performance_review",
+    "when are reviews": "performance_review",
+    "promotion criteria": "performance_review",
+    "salary review": "compensation",
+    "401k match": "compensation",
+    "stock options": "compensation",
+    "professional development budget": "compensation",
+    "do I have any active tickets": "active_tickets",
+    "my tickets": "active_tickets",
+    "outlook email sync issue": "active_tickets",
+    "core hours": "remote_work"
+}
+
+
+def main():
+    index = SearchIndex.build(KNOWLEDGE_BASE)
+    misses = []
+    for question, expected in EXPECTED.items():
+        found = [doc['id'] for doc in index.search(question)]
+        if found[:1] != [expected]:
+            misses.append((question, expected, found))
+
+    for question, expected, found in misses:
+        print(f"❌ {question!r}: expected {expected}, got {found}")
+    print(f"{len(EXPECTED) - len(misses)}/{len(EXPECTED)} questions retrieve their expected document")
+    return 1 if misses else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
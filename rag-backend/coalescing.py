@@ -0,0 +1,167 @@
+"""
+Qbit RAG Backend - Request Coalescing
+Single-flight sharing of identical LLM generations, with optional micro-batching.
+
+When many people ask the same question at once, only the first request
+starts an Ollama generation; the others join it as it runs and receive the
+same chunks, streaming or not, from the point they joined (earlier chunks
+are replayed). Requests are matched on the answer cache key: the normalized
+question plus the versions of the retrieved documents. A generation runs on
+its own thread, so it survives the request that started it disconnecting,
+and is abandoned once nobody is listening any more.
+
+With a micro-batching window, new generations are held for up to that long
+and then submitted together, up to the number of parallel slots the Ollama
+pool has, so concurrent prompts reach Ollama's slots side by side.
+"""
+
+import threading
+import time
+from collections import deque
+
+from metrics import LLM_COALESCED
+
+
+class Flight:
+    """One in-progress generation and the chunks it has produced so far."""
+
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.listeners = 1
+        self.abandoned = False
+        self._cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self):
+        """Yield every chunk of the generation, raising its error at the end."""
+        position = 0
+        try:
+            while True:
+                with self._cond:
+                    while position == len(self.chunks) and not self.done:
+                        self._cond.wait()
+                    ready = self.chunks[position:]
+                    finished, error = self.done, self.error
+                position += len(ready)
+                yield from ready
+                if finished and position == len(self.chunks):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            with self._cond:
+                self.listeners -= 1
+                if self.listeners == 0 and not self.done:
+                    self.abandoned = True
+
+
+class SingleFlight:
+    """Shares in-flight generations between requests with the same key."""
+
+    def __init__(self, batcher=None):
+        self.batcher = batcher
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def join(self, key, produce):
+        """Return (flight, leader): a new flight running produce(), or the
+        in-flight one for key. key=None never shares."""
+        with self._lock:
+            flight = self._flights.get(key) if key is not None else None
+            if flight is not None:
+                with flight._cond:
+                    if not flight.abandoned:
+                        flight.listeners += 1
+                        self.coalesced += 1
+                        LLM_COALESCED.inc()
+                        return flight, False
+            flight = Flight(key)
+            if key is not None:
+                self._flights[key] = flight
+            self.started += 1
+
+        if self.batcher is not None:
+            self.batcher.submit(lambda: self._run(flight, produce))
+        else:
+            threading.Thread(target=self._run, args=(flight, produce), name='llm-flight', daemon=True).start()
+        return flight, True
+
+    def _run(self, flight, produce):
+        chunks = produce()
+        try:
+            for chunk in chunks:
+                if flight.abandoned:
+                    break
+                flight.publish(chunk)
+        except Exception as e:
+            self._forget(flight)
+            flight.finish(e)
+        else:
+            self._forget(flight)
+            flight.finish()
+        finally:
+            chunks.close()
+
+    def _forget(self, flight):
+        # Later requests start a fresh flight (or hit the answer cache)
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "started": self.started,
+                "coalesced": self.coalesced,
+                "batches": self.batcher.batches if self.batcher is not None else None
+            }
+
+
+class MicroBatcher:
+    """Holds new generations for a short window and starts them together."""
+
+    def __init__(self, window, slots):
+        self.window = window
+        self.slots = slots  # Callable returning how many parallel slots Ollama has
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self.batches = 0
+        threading.Thread(target=self._dispatch, name='llm-batcher', daemon=True).start()
+
+    def submit(self, task):
+        with self._cond:
+            self._pending.append(task)
+            self._cond.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                size = max(1, self.slots())
+                while len(self._pending) < size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._pending.popleft() for _ in range(min(size, len(self._pending)))]
+                self.batches += 1
+            for task in batch:
+                threading.Thread(target=task, name='llm-flight', daemon=True).start()
@@ -0,0 +1,118 @@
+"""
+Qbit RAG Backend - Configuration
+Runtime settings, overridable through environment variables.
+"""
+
+import json
+import os
+
+
+def env_str(name, default):
+    """Read a string setting from the environment."""
+    return os.environ.get(name, default)
+
+
+def env_int(name, default):
+    """Read an integer setting from the environment."""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_float(name, default):
+    """Read a float setting from the environment."""
+    value = os.environ.get(name)
+    return float(value) if value not in (None, '') else default
+
+
+def env_bool(name, default):
+    """Read a boolean setting (1/true/yes/on) from the environment."""
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Server
+HOST = env_str("QBIT_HOST", "")
+PORT = env_int("QBIT_PORT", 8080)
+WORKERS = env_int("QBIT_WORKERS", 32)  # Concurrent slow (LLM-bound) requests
+MAX_CONNECTIONS = env_int("QBIT_MAX_CONNECTIONS", 256)  # Open client connections
+DRAIN_TIMEOUT = env_float("QBIT_DRAIN_TIMEOUT", 30.0)  # Seconds to finish in-flight work on shutdown
+KEEPALIVE_TIMEOUT = env_float("QBIT_KEEPALIVE_TIMEOUT", 15.0)  # Seconds an idle keep-alive connection stays open (0 = no limit)
+LISTEN_BACKLOG = env_int("QBIT_LISTEN_BACKLOG", 128)  # Connections the OS queues until they are accepted
+GZIP_MIN_BYTES = env_int("QBIT_GZIP_MIN_BYTES", 1024)  # Compress response bodies at least this large
+
+# Ollama
+OLLAMA_HOST = env_str("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_HOSTS = env_str("OLLAMA_HOSTS", "")  # Comma-separated servers to spread calls over; empty uses OLLAMA_HOST
+OLLAMA_MODEL = env_str("OLLAMA_MODEL", "llama3.1:8b")
+OLLAMA_MODEL_LABEL = env_str("OLLAMA_MODEL_LABEL", "Llama 3.1 8B (Ollama)")  # Reported as ai_model
+OLLAMA_OPTIONS = json.loads(env_str("OLLAMA_OPTIONS", "{}"))  # e.g. '{"temperature": 0.2, "num_ctx": 4096}'
+OLLAMA_POOL_SIZE = env_int("OLLAMA_POOL_SIZE", 16)  # Kept-alive connections to Ollama
+OLLAMA_CONNECT_TIMEOUT = env_float("OLLAMA_CONNECT_TIMEOUT", 3.0)
+OLLAMA_CHAT_TIMEOUT = env_float("OLLAMA_CHAT_TIMEOUT", 30.0)
+OLLAMA_NEWSLETTER_TIMEOUT = env_float("OLLAMA_NEWSLETTER_TIMEOUT", 15.0)
+OLLAMA_EMBED_MODEL = env_str("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_EMBED_TIMEOUT = env_float("OLLAMA_EMBED_TIMEOUT", 10.0)
+OLLAMA_RETRIES = env_int("OLLAMA_RETRIES", 2)  # Connection errors and 502/503/504 only
+OLLAMA_BACKOFF = env_float("OLLAMA_BACKOFF", 0.25)  # Seconds, doubled on each retry
+
+# Answer cache
+ANSWER_CACHE_SIZE = env_int("QBIT_ANSWER_CACHE_SIZE", 1024)  # Entries; 0 disables the cache
+ANSWER_CACHE_TTL = env_float("QBIT_ANSWER_CACHE_TTL", 3600.0)  # Seconds
+ANSWER_CACHE_MAX_BYTES = env_int("QBIT_ANSWER_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+
+# Request coalescing
+LLM_COALESCE = env_bool("QBIT_LLM_COALESCE", True)  # Concurrent identical questions share one generation
+LLM_BATCH_WINDOW = env_float("QBIT_LLM_BATCH_WINDOW", 0.0)  # Seconds to hold new generations to submit them together; 0 disables
+
+# Batch queries (/api/chat/batch)
+BATCH_MAX_ITEMS = env_int("QBIT_BATCH_MAX_ITEMS", 5000)  # Messages accepted in one batch request
+BATCH_PARALLELISM = env_int("QBIT_BATCH_PARALLELISM", 4)  # Messages of one batch generated at once on the worker pool
+
+# Prompt assembly
+PROMPT_DOCUMENT_TOKENS = env_int("QBIT_PROMPT_DOCUMENT_TOKENS", 768)  # Budget for retrieved text in a chat prompt
+
+# Conversation sessions
+SESSION_MAX_SESSIONS = env_int("QBIT_SESSION_MAX_SESSIONS", 10000)  # 0 disables sessions
+SESSION_TTL = env_float("QBIT_SESSION_TTL", 1800.0)  # Seconds of inactivity before a conversation is forgotten
+SESSION_MAX_BYTES = env_int("QBIT_SESSION_MAX_BYTES", 32 * 1024 * 1024)
+SESSION_MAX_TURNS = env_int("QBIT_SESSION_MAX_TURNS", 6)  # Compacted turns of history kept per conversation
+SESSION_MAX_CONTEXT_TOKENS = env_int("QBIT_SESSION_MAX_CONTEXT_TOKENS", 1536)  # Keep below num_ctx; longer contexts fall back to history
+
+# Knowledge base
+DOC_STORE = env_str("QBIT_DOC_STORE", "")  # Store directory written by ingest.py; empty uses the built-in knowledge base
+KB_FILE = env_str("QBIT_KB_FILE", "")  # JSON knowledge file replacing the built-in knowledge base
+KB_WATCH_INTERVAL = env_float("QBIT_KB_WATCH_INTERVAL", 5.0)  # Seconds between checks of the store/file for changes; 0 disables
+ADMIN_TOKEN = env_str("QBIT_ADMIN_TOKEN", "")  # Bearer token for /admin/reload; empty disables admin endpoints
+
+# Retrieval
+RETRIEVAL_MODE = env_str("QBIT_RETRIEVAL_MODE", "bm25")  # bm25, dense or hybrid
+EMBEDDER = env_str("QBIT_EMBEDDER", "ollama")  # ollama or hashing (offline stand-in); a store's own embeddings take precedence
+HASHING_DIM = env_int("QBIT_HASHING_DIM", 512)
+DENSE_IVF_LISTS = env_int("QBIT_DENSE_IVF_LISTS", 0)  # 0 = exact search over every vector
+DENSE_IVF_PROBES = env_int("QBIT_DENSE_IVF_PROBES", 8)  # Nearest lists scored per query
+DENSE_MIN_SCORE = env_float("QBIT_DENSE_MIN_SCORE", 0.0)  # Minimum cosine similarity for dense hits
+
+# Extractive answers
+EXTRACTIVE_THRESHOLD = env_float("QBIT_EXTRACTIVE_THRESHOLD", 0.8)  # Confidence (0-1) to answer from a retrieved sentence without the LLM; above 1 disables
+
+# Newsletters
+NEWSLETTER_REFRESH_INTERVAL = env_float("QBIT_NEWSLETTER_REFRESH_INTERVAL", 4 * 3600.0)  # Seconds
+NEWSLETTER_BATCH_SIZE = env_int("QBIT_NEWSLETTER_BATCH_SIZE", 2)  # Entries generated per refresh
+NEWSLETTER_RETRY_INTERVAL = env_float("QBIT_NEWSLETTER_RETRY_INTERVAL", 60.0)  # Seconds between retries until a first AI batch
+
+# Overload protection for Ollama calls
+OLLAMA_MAX_IN_FLIGHT = env_int("OLLAMA_MAX_IN_FLIGHT", 4)  # Per server; match Ollama's OLLAMA_NUM_PARALLEL
+OLLAMA_MAX_QUEUE = env_int("OLLAMA_MAX_QUEUE", 16)  # Calls allowed to wait for a slot
+OLLAMA_MAX_QUEUE_WAIT = env_float("OLLAMA_MAX_QUEUE_WAIT", 5.0)  # Seconds before a waiting call is shed
+OLLAMA_BREAKER_FAILURES = env_int("OLLAMA_BREAKER_FAILURES", 5)  # Consecutive failures that open the breaker
+OLLAMA_BREAKER_RESET = env_float("OLLAMA_BREAKER_RESET", 30.0)  # Seconds before a half-open probe
+
+# Ollama server pool
+OLLAMA_HEALTH_INTERVAL = env_float("OLLAMA_HEALTH_INTERVAL", 10.0)  # Seconds between /api/tags checks of each server; 0 disables
+OLLAMA_EJECT_FAILURES = env_int("OLLAMA_EJECT_FAILURES", 2)  # Failed checks in a row that eject a server from routing
+OLLAMA_HEDGE_PERCENTILE = env_float("OLLAMA_HEDGE_PERCENTILE", 0.0)  # e.g. 95: duplicate calls slower than p95 on a second server; 0 disables
+
+# Observability
+TRACE_LOG = env_bool("QBIT_TRACE_LOG", False)  # One JSON log line per request (always on for requests sending X-Request-ID)
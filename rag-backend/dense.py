@@ -0,0 +1,400 @@
+"""
+Qbit RAG Backend - Dense Retrieval
+Embedding similarity search, alone or fused with BM25.
+
+Chunk embeddings live in one contiguous, L2-normalized float32 matrix, so a
+query is scored against the whole corpus with a single matrix-vector product
+and the top k are picked with argpartition instead of a full sort. For large
+corpora an optional IVF index clusters the rows with spherical k-means and
+only scores the rows in the few clusters nearest to the query.
+
+Embeddings come from Ollama's /api/embed, or from HashingEmbedder, a
+model-free stand-in for tests and benchmarks.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+
+import config
+from retrieval import tokenize
+
+RETRIEVAL_MODES = ('bm25', 'dense', 'hybrid')
+
+# Reciprocal rank fusion constant; dampens the weight of top ranks
+RRF_K = 60
+
+# Each side of a hybrid search contributes this many candidates per result
+HYBRID_CANDIDATES = 4
+
+# Batch searches score queries in blocks of about this many similarities
+SCORE_BLOCK_ELEMENTS = 1 << 22
+
+# Rows sampled per IVF list when training the k-means centroids
+IVF_TRAINING_ROWS_PER_LIST = 256
+
+
+def normalize_rows(matrix):
+    """Scale each row to unit length (zero rows stay zero)."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores, k):
+    """Indexes of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+@lru_cache(maxsize=65536)
+def _feature_slot(feature, dim):
+    digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+    return digest % dim, 1.0 if digest >> 63 else -1.0
+
+
+class HashingEmbedder:
+    """Signed feature hashing of unigrams and bigrams; no model required."""
+
+    name = "hashing"
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.model = f"hashing-{dim}"
+
+    def embed_one(self, text, out):
+        tokens = tokenize(text)
+        counts = {}
+        for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            counts[feature] = counts.get(feature, 0) + 1
+        for feature, count in counts.items():
+            slot, sign = _feature_slot(feature, self.dim)
+            out[slot] += sign * (1.0 + math.log(count))
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in zip(matrix, texts):
+            self.embed_one(text, row)
+        return normalize_rows(matrix)
+
+    def describe(self):
+        return {"embedder": self.name, "model": self.model, "dim": self.dim}
+
+
+class OllamaEmbedder:
+    """Embeddings from Ollama's /api/embed via the shared client."""
+
+    name = "ollama"
+
+    def __init__(self, client, model=None, batch_size=32):
+        self.client = client
+        self.model = model or config.OLLAMA_EMBED_MODEL
+        self.batch_size = batch_size
+        self.dim = None
+
+    def embed(self, texts):
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            rows.extend(self.client.embed(texts[start:start + self.batch_size], model=self.model))
+        matrix = normalize_rows(np.asarray(rows, dtype=np.float32).reshape(len(texts), -1))
+        self.dim = matrix.shape[1]
+        return matrix
+
+    def describe(self):
+        return {"embedder": self.name, "model": self.model, "dim": self.dim}
+
+
+def create_embedder(name=None, model=None, dim=None):
+    """Build the embedder named in config (or in a store's manifest)."""
+    name = name or config.EMBEDDER
+    if name == 'hashing':
+        return HashingEmbedder(dim or config.HASHING_DIM)
+    if name == 'ollama':
+        from ollama_pool import get_client
+        return OllamaEmbedder(get_client(), model)
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+def create_retriever(search_index, store=None):
+    """Build the Retriever for config.RETRIEVAL_MODE.
+
+    A document store ingested with --embedder brings its own embeddings, and
+    queries are embedded with the same embedder; otherwise the corpus is
+    embedded at startup with the configured one.
+    """
+    mode = config.RETRIEVAL_MODE
+    embedder = embeddings = None
+    if mode != 'bm25':
+        embedding = store.manifest.get('embedding') if store is not None else None
+        if embedding:
+            embedder = create_embedder(embedding['embedder'], embedding['model'], embedding['dim'])
+            embeddings = store.embeddings()
+        else:
+            embedder = create_embedder()
+    return Retriever(search_index, mode, embedder, embeddings,
+                     ivf_lists=config.DENSE_IVF_LISTS, probes=config.DENSE_IVF_PROBES,
+                     min_score=config.DENSE_MIN_SCORE)
+
+
+class IVFIndex:
+    """Inverted-file index: rows grouped by nearest k-means centroid."""
+
+    def __init__(self, centroids, order, offsets):
+        self.centroids = centroids  # (lists, dim)
+        self.order = order  # row indexes grouped by list
+        self.offsets = offsets  # list c owns order[offsets[c]:offsets[c + 1]]
+
+    @classmethod
+    def train(cls, matrix, lists, iterations=10, seed=0):
+        """Spherical k-means on a sample of the rows, then assign every row."""
+        rng = np.random.default_rng(seed)
+        lists = max(1, min(lists, len(matrix)))
+        sample_size = min(len(matrix), lists * IVF_TRAINING_ROWS_PER_LIST)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # Keep centroids that lost all rows
+            centroids = normalize_rows(sums)
+
+        return cls.assign(matrix, centroids)
+
+    @classmethod
+    def assign(cls, matrix, centroids):
+        """Group every row under its nearest centroid (no retraining)."""
+        assignments = np.concatenate([
+            np.argmax(matrix[start:start + 65536] @ centroids.T, axis=1)
+            for start in range(0, len(matrix), 65536)
+        ])
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))))
+        return cls(centroids, order, offsets)
+
+    def candidates(self, vector, probes):
+        """Row indexes in the probes lists nearest to the query vector."""
+        nearest = top_k(self.centroids @ vector, min(probes, len(self.centroids)))
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in nearest])
+
+
+class DenseIndex:
+    """Unit-length embedding matrix with exact or IVF top-k search."""
+
+    def __init__(self, matrix, ivf=None, probes=8):
+        self.matrix = matrix
+        self.ivf = ivf
+        self.probes = probes
+
+    @classmethod
+    def build(cls, matrix, ivf_lists=0, probes=8):
+        ivf = IVFIndex.train(matrix, ivf_lists) if ivf_lists and len(matrix) > ivf_lists else None
+        return cls(matrix, ivf, probes)
+
+    def with_matrix(self, matrix):
+        """Same IVF centroids over a new matrix, e.g. after documents changed."""
+        ivf = IVFIndex.assign(matrix, self.ivf.centroids) if self.ivf is not None else None
+        return DenseIndex(matrix, ivf, self.probes)
+
+    def search(self, vector, k):
+        """Return [(row, similarity)] for the k most similar rows, best first."""
+        if self.ivf is None:
+            scores = self.matrix @ vector
+            best = top_k(scores, k)
+            return [(int(row), float(scores[row])) for row in best]
+
+        rows = self.ivf.candidates(vector, self.probes)
+        scores = self.matrix[rows] @ vector
+        best = top_k(scores, k)
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def search_many(self, vectors, k):
+        """search() for each row of vectors; exact search scores a block of
+        queries with one matrix product."""
+        if self.ivf is not None:
+            return [self.search(vector, k) for vector in vectors]
+        results = []
+        block = max(1, SCORE_BLOCK_ELEMENTS // max(1, len(self.matrix)))
+        for start in range(0, len(vectors), block):
+            scores = vectors[start:start + block] @ self.matrix.T
+            for row_scores in scores:
+                best = top_k(row_scores, k)
+                results.append([(int(row), float(row_scores[row])) for row in best])
+        return results
+
+
+def reciprocal_rank_fusion(*rankings):
+    """Fuse [(doc_index, score)] rankings by summing 1 / (RRF_K + rank)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_index, _) in enumerate(ranking):
+            fused[doc_index] = fused.get(doc_index, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class Retriever:
+    """Routes searches to BM25, dense or hybrid retrieval.
+
+    The dense index is built by build() (normally on a background thread);
+    until it is ready, or whenever embedding the query fails, searches fall
+    back to BM25 so chat keeps working.
+    """
+
+    def __init__(self, search_index, mode='bm25', embedder=None, embeddings=None,
+                 ivf_lists=0, probes=8, min_score=0.0):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        self.search_index = search_index
+        self.mode = mode
+        self.embedder = embedder
+        self.embeddings = embeddings
+        self.ivf_lists = ivf_lists
+        self.probes = probes
+        self.min_score = min_score  # Cosine similarity below which dense hits are dropped
+        self.dense = None
+        self.fallbacks = 0
+        self.retired = False  # Set once a newer knowledge snapshot replaces this one
+
+    @property
+    def ready(self):
+        return self.mode == 'bm25' or self.dense is not None
+
+    def build(self):
+        """Embed the corpus (unless embeddings were supplied) and index it.
+
+        Returns False if the corpus could not be embedded.
+        """
+        if self.mode == 'bm25' or self.dense is not None:
+            return True
+        started = time.perf_counter()
+        matrix = self.embeddings
+        if matrix is None:
+            doc_ids = self.search_index.doc_ids
+            rows = [row for row in range(len(doc_ids)) if doc_ids[row] is not None]
+            try:
+                vectors = self.embedder.embed([self.search_index.document(row)[1]['content'] for row in rows])
+            except Exception as e:
+                print(f"⚠️ Could not embed the knowledge base ({e}); using BM25 retrieval for now")
+                return False
+            matrix = np.zeros((len(doc_ids), vectors.shape[1]), dtype=np.float32)
+            matrix[rows] = vectors
+        self.dense = DenseIndex.build(matrix, self.ivf_lists, self.probes)
+        print(f"🧭 Dense index ready: {len(matrix)} vectors x {matrix.shape[1]} dims"
+              f"{f', {self.ivf_lists} IVF lists' if self.dense.ivf else ''} "
+              f"in {time.perf_counter() - started:.2f}s")
+        return True
+
+    def start(self, retry_interval=30.0):
+        """Build the dense index on a background thread, retrying until it succeeds."""
+        def build_until_ready():
+            while not self.retired and not self.build():
+                time.sleep(retry_interval)
+
+        if not self.ready:
+            threading.Thread(target=build_until_ready, name='dense-index', daemon=True).start()
+
+    def updated(self, search_index, upserted_ids=()):
+        """Return a Retriever over a new search index.
+
+        Rows of unchanged documents are copied by doc id and only the
+        upserted ones are embedded; emptied slots get zero vectors, which
+        never pass the similarity cut-off. If those embeddings cannot be
+        made, the new retriever rebuilds its dense index from scratch.
+        """
+        retriever = Retriever(search_index, self.mode, self.embedder, None,
+                              self.ivf_lists, self.probes, self.min_score)
+        if self.dense is None:
+            return retriever
+
+        old_rows = {doc_id: row for row, doc_id in enumerate(self.search_index.doc_ids)
+                    if doc_id is not None}
+        upserted_ids = set(upserted_ids)
+        matrix = np.zeros((len(search_index.doc_ids), self.dense.matrix.shape[1]), dtype=np.float32)
+        embed_rows = []
+        for row, doc_id in enumerate(search_index.doc_ids):
+            if doc_id is None:
+                continue
+            if doc_id in upserted_ids or doc_id not in old_rows:
+                embed_rows.append(row)
+            else:
+                matrix[row] = self.dense.matrix[old_rows[doc_id]]
+
+        if embed_rows:
+            try:
+                matrix[embed_rows] = self.embedder.embed(
+                    [search_index.document(row)[1]['content'] for row in embed_rows])
+            except Exception as e:
+                print(f"⚠️ Could not embed updated documents ({e}); rebuilding the dense index")
+                return retriever
+        retriever.dense = self.dense.with_matrix(matrix)
+        return retriever
+
+    def rank(self, query, k=3):
+        if self.dense is None:
+            return self.search_index.rank(query, k)
+        try:
+            vector = self.embedder.embed([query])[0]
+        except Exception as e:
+            self.fallbacks += 1
+            print(f"⚠️ Query embedding failed ({e}); using BM25 retrieval")
+            return self.search_index.rank(query, k)
+
+        if self.mode == 'dense':
+            return self.dense_rank(vector, k)
+        candidates = k * HYBRID_CANDIDATES
+        return reciprocal_rank_fusion(
+            self.search_index.rank(query, candidates),
+            self.dense_rank(vector, candidates)
+        )[:k]
+
+    def rank_many(self, queries, k=3):
+        """rank() for a batch of queries, embedding them in one call."""
+        if self.dense is None:
+            return [self.search_index.rank(query, k) for query in queries]
+        try:
+            vectors = self.embedder.embed(list(queries))
+        except Exception as e:
+            self.fallbacks += 1
+            print(f"⚠️ Query embedding failed ({e}); using BM25 retrieval")
+            return [self.search_index.rank(query, k) for query in queries]
+
+        candidates = k if self.mode == 'dense' else k * HYBRID_CANDIDATES
+        dense_rankings = [[(row, score) for row, score in ranking if score > self.min_score]
+                          for ranking in self.dense.search_many(vectors, candidates)]
+        if self.mode == 'dense':
+            return dense_rankings
+        return [reciprocal_rank_fusion(self.search_index.rank(query, candidates), ranking)[:k]
+                for query, ranking in zip(queries, dense_rankings)]
+
+    def dense_rank(self, vector, k):
+        return [(row, score) for row, score in self.dense.search(vector, k)
+                if score > self.min_score]
+
+    def search(self, query, k=3):
+        """Return the top-k documents for the query, best first."""
+        return self.search_index.results(self.rank(query, k))
+
+    def search_many(self, queries, k=3):
+        """search() for a batch of queries; repeated queries are ranked once."""
+        distinct = list(dict.fromkeys(queries))
+        ranked = dict(zip(distinct, self.rank_many(distinct, k)))
+        return [self.search_index.results(ranked[query]) for query in queries]
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "ready": self.ready,
+            "vectors": len(self.dense.matrix) if self.dense is not None else 0,
+            "ivf_lists": len(self.dense.ivf.centroids) if self.dense is not None and self.dense.ivf else 0,
+            "embedder": self.embedder.describe() if self.embedder is not None else None,
+            "fallbacks": self.fallbacks
+        }
@@ -0,0 +1,320 @@
+"""
+Qbit RAG Backend - Document Store
+Compact on-disk format for chunked documents and their prebuilt BM25 index.
+
+A store is a directory written by ingest.py:
+
+    manifest.json        summary: counts, categories, sources, chunking settings
+    documents.json       source document table [{id, source, category, chunks}, ...]
+    chunks.bin           one fixed-size record per chunk (content offset/length, document, chunk number)
+    content.bin          UTF-8 chunk text, back to back
+    terms.json           {term: [start, count]} into the postings arrays
+    postings_docs.bin    uint32 chunk indexes, impact-ordered per term
+    postings_impacts.bin float32 BM25 impacts, parallel to postings_docs.bin
+    embeddings.npy       optional float32 chunk embeddings for dense retrieval
+
+Opening a store reads only manifest.json. The binary files are memory-mapped
+on first use, and the document table and term dictionary are parsed the first
+time a search needs them, so startup cost does not grow with the corpus.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from retrieval import SearchIndex
+
+# Bumped when the file layout or index term normalization changes; older stores must be re-ingested
+STORE_FORMAT = 2
+
+# content offset, content length, document index, chunk number
+CHUNK_RECORD = struct.Struct('<QIII')
+
+
+def summarize_documents(documents):
+    """Knowledge base summary for an in-memory {doc_id: doc} mapping."""
+    return {
+        "total_documents": len(documents),
+        "categories": sorted(set(doc["category"] for doc in documents.values())),
+        "sources": sorted(set(doc["source"] for doc in documents.values()))
+    }
+
+
+def chunk_id(doc_id, chunk_no, chunk_total):
+    """Chunks of single-chunk documents keep the document's own id."""
+    return doc_id if chunk_total == 1 else f"{doc_id}#{chunk_no}"
+
+
+def write_store(path, documents, chunks, chunk_size, chunk_overlap, embeddings=None, embedding=None):
+    """Write a store directory atomically.
+
+    documents is the source table [{id, source, category}], chunks a list of
+    (document index, chunk number, content) in index order. embeddings is an
+    optional (chunks, dim) float32 array, described by the embedding dict
+    (embedder, model, dim).
+    """
+    documents = [dict(doc, chunks=0) for doc in documents]
+    for doc_index, _, _ in chunks:
+        documents[doc_index]['chunks'] += 1
+
+    chunk_docs = {}
+    for doc_index, chunk_no, content in chunks:
+        doc = documents[doc_index]
+        chunk_docs[chunk_id(doc['id'], chunk_no, doc['chunks'])] = {
+            "content": content,
+            "source": doc['source'],
+            "category": doc['category']
+        }
+    index = SearchIndex.build(chunk_docs)
+
+    staging = f"{path.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    with open(os.path.join(staging, 'content.bin'), 'wb') as content_file, \
+            open(os.path.join(staging, 'chunks.bin'), 'wb') as chunk_file:
+        offset = 0
+        for doc_index, chunk_no, content in chunks:
+            data = content.encode('utf-8')
+            content_file.write(data)
+            chunk_file.write(CHUNK_RECORD.pack(offset, len(data), doc_index, chunk_no))
+            offset += len(data)
+
+    terms = {}
+    doc_column = array('I')
+    impact_column = array('f')
+    for term in sorted(index.postings):
+        doc_indexes, impacts = index.postings[term]
+        terms[term] = [len(doc_column), len(doc_indexes)]
+        doc_column.extend(doc_indexes)
+        impact_column.extend(impacts.tolist())  # float64 in memory, float32 on disk
+    with open(os.path.join(staging, 'postings_docs.bin'), 'wb') as f:
+        doc_column.tofile(f)
+    with open(os.path.join(staging, 'postings_impacts.bin'), 'wb') as f:
+        impact_column.tofile(f)
+
+    with open(os.path.join(staging, 'terms.json'), 'w') as f:
+        json.dump(terms, f, separators=(',', ':'))
+    with open(os.path.join(staging, 'documents.json'), 'w') as f:
+        json.dump(documents, f, separators=(',', ':'))
+
+    if embeddings is not None:
+        np.save(os.path.join(staging, 'embeddings.npy'), np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    manifest = {
+        "format": STORE_FORMAT,
+        "byteorder": sys.byteorder,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "document_count": len(documents),
+        "chunk_count": len(chunks),
+        "term_count": len(terms),
+        "categories": sorted(set(doc['category'] for doc in documents)),
+        "sources": sorted(set(doc['source'] for doc in documents)),
+        "embedding": embedding if embeddings is not None else None
+    }
+    with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the finished store into place
+    if os.path.exists(path):
+        retired = f"{path.rstrip(os.sep)}.old-{os.getpid()}"
+        os.replace(path, retired)
+        os.replace(staging, path)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(staging, path)
+    return manifest
+
+
+class DocumentStore:
+    """Read-only, lazily loaded view of a store directory."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != STORE_FORMAT:
+            raise ValueError(f"Unsupported document store format in {path}: {self.manifest.get('format')}")
+        if self.manifest.get('byteorder') != sys.byteorder:
+            raise ValueError(f"Document store {path} was written on a {self.manifest.get('byteorder')}-endian machine")
+
+        self._lock = threading.Lock()
+        self._files = []
+        self._views = {}
+        self._documents = None
+        self._terms = None
+        self._closed = False
+
+    def _view(self, name, fmt='B'):
+        """Memory-map a store file on first use and return a typed memoryview."""
+        view = self._views.get((name, fmt))
+        if view is None:
+            with self._lock:
+                view = self._views.get((name, fmt))
+                if view is None:
+                    if self._closed:
+                        raise ValueError(f"Document store {self.path} is closed")
+                    with open(os.path.join(self.path, name), 'rb') as f:
+                        if os.fstat(f.fileno()).st_size == 0:
+                            view = memoryview(b'').cast(fmt)
+                        else:
+                            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                            self._files.append(mapped)
+                            view = memoryview(mapped).cast(fmt)
+                    self._views[(name, fmt)] = view
+        return view
+
+    def _load_json(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return json.load(f)
+
+    @property
+    def documents(self):
+        """Source document table, parsed on first use."""
+        if self._documents is None:
+            with self._lock:
+                if self._documents is None:
+                    self._documents = self._load_json('documents.json')
+        return self._documents
+
+    @property
+    def terms(self):
+        """Term dictionary {term: [start, count]}, parsed on first use."""
+        if self._terms is None:
+            with self._lock:
+                if self._terms is None:
+                    self._terms = self._load_json('terms.json')
+        return self._terms
+
+    def __len__(self):
+        return self.manifest['chunk_count']
+
+    def summary(self):
+        """Knowledge base summary for /api/knowledge, straight from the manifest."""
+        return {
+            "total_documents": self.manifest['document_count'],
+            "total_chunks": self.manifest['chunk_count'],
+            "categories": self.manifest['categories'],
+            "sources": self.manifest['sources']
+        }
+
+    def _record(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return CHUNK_RECORD.unpack_from(self._view('chunks.bin'), index * CHUNK_RECORD.size)
+
+    def chunk_id(self, index):
+        _, _, doc_index, chunk_no = self._record(index)
+        doc = self.documents[doc_index]
+        return chunk_id(doc['id'], chunk_no, doc['chunks'])
+
+    def chunk(self, index):
+        """Return (chunk_id, {content, source, category}) for a chunk position."""
+        offset, length, doc_index, _ = self._record(index)
+        doc = self.documents[doc_index]
+        content = bytes(self._view('content.bin')[offset:offset + length]).decode('utf-8')
+        return self.chunk_id(index), {
+            "content": content,
+            "source": doc['source'],
+            "category": doc['category']
+        }
+
+    def postings(self, term):
+        """(doc_indexes, impacts) views for a term, or None."""
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        start, count = entry
+        return (self._view('postings_docs.bin', 'I')[start:start + count],
+                self._view('postings_impacts.bin', 'f')[start:start + count])
+
+    def embeddings(self):
+        """Memory-mapped chunk embedding matrix, or None if the store has none."""
+        if not self.manifest.get('embedding'):
+            return None
+        return np.load(os.path.join(self.path, 'embeddings.npy'), mmap_mode='r')
+
+    def search_index(self):
+        return StoredSearchIndex(self)
+
+    def warm(self):
+        """Load the lazily parsed tables and map the data files now."""
+        self.documents
+        self.terms
+        self._view('chunks.bin')
+        self._view('content.bin')
+        self._view('postings_docs.bin', 'I')
+        self._view('postings_impacts.bin', 'f')
+
+    def close(self):
+        """Unmap the data files; the knowledge base calls this once no request
+        uses the snapshot serving this store any more."""
+        with self._lock:
+            self._closed = True
+            self._views.clear()
+            for mapped in self._files:
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass  # Still referenced by an in-flight search
+            self._files.clear()
+
+
+class StoreChunkIds:
+    """Sequence of chunk ids, resolved from the store on access."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        return self.store.chunk_id(index)
+
+
+class StorePostings:
+    """Mapping-like access to a store's postings lists."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, term, default=None):
+        postings = self.store.postings(term)
+        return default if postings is None else postings
+
+    def __getitem__(self, term):
+        postings = self.store.postings(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    def __contains__(self, term):
+        return term in self.store.terms
+
+    def __iter__(self):
+        return iter(self.store.terms)
+
+    def __len__(self):
+        return self.store.manifest['term_count']
+
+
+class StoredSearchIndex(SearchIndex):
+    """SearchIndex answering from a DocumentStore's prebuilt postings."""
+
+    def __init__(self, store, keyword_mapping=None):
+        super().__init__(StoreChunkIds(store), None, StorePostings(store), keyword_mapping)
+        self.store = store
+
+    def document(self, doc_index):
+        return self.store.chunk(doc_index)
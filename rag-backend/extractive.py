@@ -0,0 +1,114 @@
+"""
+Qbit RAG Backend - Extractive Answers
+Answers factual questions straight from a retrieved sentence, without the LLM.
+
+Many questions ("how many sick days", "what's the dental coverage") are
+answered verbatim by one sentence of one retrieved document. The retrieved
+documents are split into sentences and each sentence is scored by how much
+of the question's idf-weighted content it covers. If the best sentence clears
+the confidence threshold, and no sentence elsewhere scores almost as well,
+that sentence is the answer and the LLM is skipped. Questions asking for
+explanation, advice or new text always go to the LLM.
+"""
+
+import math
+import re
+
+from retrieval import SYNONYM_WEIGHT, tokenize
+
+# Sentence ends before whitespace followed by an uppercase letter, digit or quote
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z0-9"\'])')
+
+# Question scaffolding that says nothing about which fact is wanted
+QUESTION_WORDS = frozenset("""
+s t any many much long often get got have has had need know tell please
+am im ive id ll way there
+""".split())
+
+# Requests that need synthesis rather than a lookup
+GENERATIVE_CUES = frozenset("""
+why explain summarize summarise summary compare difference write draft
+recommend suggest should advice help plan describe
+""".split())
+
+# A runner-up sentence scoring within this margin of the best one makes the
+# answer ambiguous, so the question goes to the LLM instead
+AMBIGUITY_MARGIN = 0.15
+
+# Longest sentence worth returning on its own
+MAX_ANSWER_WORDS = 60
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence.strip()]
+
+
+def term_idf(index, term):
+    """BM25 idf of a term, read from the index's postings."""
+    posting = index.postings.get(term)
+    df = len(posting[0]) if posting is not None else 0
+    total = max(len(index.doc_ids), df)
+    return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+
+def question_terms(query, index):
+    """{term: (idf, synonym terms)} for the content words of a question, or None
+    when the question asks for something an extract can't provide."""
+    words = set(re.findall(r"[a-z0-9]+", query.lower()))
+    if words & GENERATIVE_CUES:
+        return None
+    terms = {}
+    for term in tokenize(query):
+        if term not in QUESTION_WORDS and term not in terms:
+            terms[term] = (term_idf(index, term), index.term_expansions.get(term, ()))
+    return terms or None
+
+
+def sentence_confidence(sentence_terms, terms):
+    """Idf-weighted share of the question terms found in a sentence (0..1);
+    a synonym earns partial credit."""
+    total = matched = 0.0
+    for term, (idf, synonyms) in terms.items():
+        total += idf
+        if term in sentence_terms:
+            matched += idf
+        elif any(synonym in sentence_terms for synonym in synonyms):
+            matched += SYNONYM_WEIGHT * idf
+    return matched / total if total else 0.0
+
+
+def extract_answer(query, docs, index, threshold=0.8):
+    """Return {answer, source, doc_id, confidence} for a confident extract, else None."""
+    terms = question_terms(query, index)
+    if not terms or not docs:
+        return None
+
+    scored = []
+    for doc in docs:
+        # Sentences inherit their document's category and id terms, so
+        # "IT support extension" matches "Phone Support: Extension ..."; the
+        # sentence's own coverage breaks ties between sentences of one document
+        context = set(tokenize(doc['category'])) | set(tokenize(doc['id'].replace('_', ' ')))
+        for sentence in split_sentences(doc['content']):
+            sentence_terms = set(tokenize(sentence))
+            confidence = sentence_confidence(sentence_terms | context, terms)
+            if confidence > 0:
+                scored.append((confidence, sentence_confidence(sentence_terms, terms), sentence, doc))
+    if not scored:
+        return None
+
+    scored.sort(key=lambda item: item[:2], reverse=True)
+    confidence, own, sentence, doc = scored[0]
+    if confidence < threshold or len(sentence.split()) > MAX_ANSWER_WORDS:
+        return None
+    if len(scored) > 1:
+        runner_up, runner_up_own = scored[1][:2]
+        if runner_up > confidence - AMBIGUITY_MARGIN and runner_up_own > own - AMBIGUITY_MARGIN:
+            return None
+
+    return {
+        "answer": sentence,
+        "source": doc['source'],
+        "doc_id": doc['id'],
+        "confidence": round(confidence, 4)
+    }
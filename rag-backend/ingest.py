@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Qbit RAG Backend - Ingestion
+Chunk source documents and write them to an on-disk document store.
+
+Sources can be .txt and .md files (with optional front matter setting
+category and source), .json files holding either a {doc_id: doc} mapping in
+the KNOWLEDGE_BASE format or a list of {id, content, source, category}
+objects, or directories of those. Documents are split into overlapping word
+windows and the BM25 index is built once here, so the server only has to
+memory-map the result at startup.
+
+    python3 ingest.py --output data/store docs/ extra_policies.json
+    python3 ingest.py --output data/store --builtin
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from document_store import write_store
+
+SUPPORTED_EXTENSIONS = ('.txt', '.md', '.json')
+
+_FRONT_MATTER_RE = re.compile(r'\A---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+
+
+def chunk_words(text, chunk_size=120, overlap=30):
+    """Split text into windows of chunk_size words sharing overlap words."""
+    words = text.split()
+    if len(words) <= chunk_size:
+        return [" ".join(words)] if words else []
+    step = max(1, chunk_size - overlap)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_size]))
+        if start + chunk_size >= len(words):
+            break
+    return chunks
+
+
+def doc_id_from_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') or 'document'
+
+
+def load_text_file(path):
+    """Load a .txt/.md file, honouring 'key: value' front matter."""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    meta = {}
+    match = _FRONT_MATTER_RE.match(text)
+    if match:
+        for line in match.group(1).splitlines():
+            key, _, value = line.partition(':')
+            if value:
+                meta[key.strip().lower()] = value.strip().strip('"\'')
+        text = text[match.end():]
+
+    return [{
+        "id": meta.get('id', doc_id_from_path(path)),
+        "content": text,
+        "source": meta.get('source', os.path.basename(path)),
+        "category": meta.get('category', 'general')
+    }]
+
+
+def load_json_file(path):
+    """Load documents from a {doc_id: doc} mapping or a list of documents."""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return [dict(doc, id=doc_id) for doc_id, doc in data.items()]
+    return [dict(doc, id=doc.get('id') or f"{doc_id_from_path(path)}_{n}")
+            for n, doc in enumerate(data)]
+
+
+def load_documents(paths):
+    """Load every supported file under the given files and directories."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(SUPPORTED_EXTENSIONS))
+        else:
+            files.append(path)
+
+    documents = []
+    for path in sorted(files):
+        if path.lower().endswith('.json'):
+            documents.extend(load_json_file(path))
+        else:
+            documents.extend(load_text_file(path))
+    return documents
+
+
+def ingest(documents, output, chunk_size=120, overlap=30, embedder=None):
+    """Chunk documents and write the store; returns its manifest.
+
+    With an embedder (see dense.create_embedder) the chunk embeddings are
+    computed here and stored for dense retrieval.
+    """
+    table = []
+    chunks = []
+    seen = set()
+    for doc in documents:
+        if doc['id'] in seen:
+            print(f"⚠️ Skipping duplicate document id: {doc['id']}")
+            continue
+        seen.add(doc['id'])
+
+        doc_chunks = chunk_words(doc.get('content', ''), chunk_size, overlap)
+        if not doc_chunks:
+            continue
+        doc_index = len(table)
+        table.append({
+            "id": doc['id'],
+            "source": doc.get('source', doc['id']),
+            "category": doc.get('category', 'general')
+        })
+        chunks.extend((doc_index, chunk_no, content) for chunk_no, content in enumerate(doc_chunks))
+
+    embeddings = None
+    if embedder is not None:
+        embeddings = embedder.embed([content for _, _, content in chunks])
+    return write_store(output, table, chunks, chunk_size, overlap, embeddings,
+                       embedder.describe() if embedder is not None else None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Qbit document store from source documents")
+    parser.add_argument('paths', nargs='*', help=".txt, .md or .json files, or directories of them")
+    parser.add_argument('--output', required=True, help="store directory to create or replace")
+    parser.add_argument('--builtin', action='store_true', help="include the built-in knowledge base")
+    parser.add_argument('--chunk-size', type=int, default=120, help="words per chunk")
+    parser.add_argument('--overlap', type=int, default=30, help="words shared by consecutive chunks")
+    parser.add_argument('--embedder', choices=('ollama', 'hashing'),
+                        help="also store chunk embeddings for dense/hybrid retrieval")
+    args = parser.parse_args()
+
+    if args.overlap >= args.chunk_size:
+        parser.error("--overlap must be smaller than --chunk-size")
+
+    documents = []
+    if args.builtin:
+        from ollama_rag import KNOWLEDGE_BASE
+        documents.extend(dict(doc, id=doc_id) for doc_id, doc in KNOWLEDGE_BASE.items())
+    documents.extend(load_documents(args.paths))
+    if not documents:
+        parser.error("no documents to ingest (pass paths and/or --builtin)")
+
+    embedder = None
+    if args.embedder:
+        from dense import create_embedder
+        embedder = create_embedder(args.embedder)
+
+    started = time.perf_counter()
+    manifest = ingest(documents, args.output, args.chunk_size, args.overlap, embedder)
+    print(f"📦 Wrote {manifest['document_count']} documents as {manifest['chunk_count']} chunks "
+          f"({manifest['term_count']} terms) to {args.output} in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
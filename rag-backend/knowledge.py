@@ -0,0 +1,254 @@
+"""
+Qbit RAG Backend - Knowledge Base
+Versioned, immutable knowledge snapshots with hot reload.
+
+A request reads KnowledgeBase.snapshot once and works against that snapshot
+until it finishes. A reload builds a complete new snapshot to one side,
+applying added, changed and removed documents incrementally to the search
+index, and publishes it with a single attribute assignment. The read path
+never takes a lock, and in-flight chats keep the version they started with.
+
+Changes arrive through the authenticated POST /admin/reload endpoint, or from
+a watcher that polls the knowledge file (QBIT_KB_FILE) or the document
+store's manifest (QBIT_DOC_STORE) for modifications.
+"""
+
+import os
+import threading
+import time
+
+from answer_cache import document_version
+from dense import create_retriever
+from document_store import DocumentStore, summarize_documents
+from ingest import load_json_file
+from retrieval import SearchIndex
+
+DOCUMENT_FIELDS = ('content', 'source', 'category')
+
+
+class ReloadError(Exception):
+    """Raised when a knowledge base change cannot be applied."""
+
+
+def utc_now():
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+
+def load_knowledge_file(path):
+    """Read a JSON knowledge file ({doc_id: doc} or a list of documents)."""
+    return {
+        doc['id']: {field: doc.get(field, '') for field in DOCUMENT_FIELDS}
+        for doc in load_json_file(path)
+    }
+
+
+def validate_documents(documents):
+    for doc_id, doc in documents.items():
+        if not isinstance(doc, dict) or not all(isinstance(doc.get(field), str) for field in DOCUMENT_FIELDS):
+            raise ReloadError(f"Document {doc_id!r} needs string content, source and category")
+
+
+class KnowledgeSnapshot:
+    """One immutable version of the knowledge base and its search structures."""
+
+    def __init__(self, version, retriever, summary=None, documents=None, store=None):
+        self.version = version
+        self.retriever = retriever
+        self._summary = summary
+        self.documents = documents  # {doc_id: doc}, or None when served from a store
+        self.store = store
+        self.updated_at = utc_now()
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._retired = False
+        self._closed = False
+
+    @property
+    def summary(self):
+        """Knowledge base summary, computed from the documents on first use
+        rather than on every reload."""
+        if self._summary is None:
+            self._summary = summarize_documents(self.documents)
+        return self._summary
+
+    def acquire(self):
+        """Register a reader; False once the snapshot has been retired and closed."""
+        with self._lock:
+            if self._closed:
+                return False
+            self._readers += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            close = self._retired and not self._readers and not self._closed
+            self._closed = self._closed or close
+        if close:
+            self._close()
+
+    def retire(self):
+        """Mark the snapshot replaced; its store closes once the last reader releases it."""
+        with self._lock:
+            self._retired = True
+            close = not self._readers and not self._closed
+            self._closed = self._closed or close
+        if close:
+            self._close()
+
+    def _close(self):
+        self.retriever.retired = True
+        if self.store is not None:
+            self.store.close()
+
+    @property
+    def index(self):
+        return self.retriever.search_index
+
+    def describe(self):
+        """Summary for /api/knowledge, tagged with this snapshot's version."""
+        return dict(self.summary, version=self.version, updated_at=self.updated_at)
+
+
+class KnowledgeBase:
+    """Holds the current snapshot and publishes new ones on reload."""
+
+    def __init__(self, documents=None, store_path=None, kb_file=None,
+                 watch_interval=0.0, on_change=None):
+        self.store_path = store_path
+        self.kb_file = kb_file
+        self.watch_interval = watch_interval
+        self.on_change = on_change  # Called with (snapshot, changed doc ids or None for all)
+        self._lock = threading.Lock()  # Serializes writers; readers never take it
+        self._stop = threading.Event()
+        self._watcher = None
+        self._source_mtime = self._mtime()
+
+        if store_path:
+            self.snapshot = self._store_snapshot(1)
+        else:
+            if kb_file:
+                documents = load_knowledge_file(kb_file)
+            index = SearchIndex.build(dict(documents))
+            self.snapshot = KnowledgeSnapshot(1, create_retriever(index), documents=index.documents)
+
+    def _source_path(self):
+        if self.store_path:
+            return os.path.join(self.store_path, 'manifest.json')
+        return self.kb_file
+
+    def _mtime(self):
+        path = self._source_path()
+        try:
+            return os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            return None
+
+    def _store_snapshot(self, version):
+        store = DocumentStore(self.store_path)
+        return KnowledgeSnapshot(version, create_retriever(store.search_index(), store),
+                                 store.summary(), store=store)
+
+    def acquire(self):
+        """The current snapshot, registered as in use until release() is called."""
+        while True:
+            snapshot = self.snapshot
+            if snapshot.acquire():
+                return snapshot
+
+    def _publish(self, snapshot, changed_ids):
+        previous, self.snapshot = self.snapshot, snapshot
+        previous.retriever.retired = True
+        previous.retire()
+        snapshot.retriever.start()
+        if self.on_change is not None:
+            self.on_change(snapshot, changed_ids)
+
+    def apply(self, upserts=None, deletions=()):
+        """Add, replace or remove documents; returns a summary of the change."""
+        if upserts is not None and not isinstance(upserts, dict):
+            raise ReloadError('"upsert" must be an object of {doc_id: document}')
+        if not isinstance(deletions, (list, tuple)) or not all(isinstance(doc_id, str) for doc_id in deletions):
+            raise ReloadError('"delete" must be a list of document ids')
+        upserts = dict(upserts or {})
+        validate_documents(upserts)
+        started = time.perf_counter()
+
+        with self._lock:
+            current = self.snapshot
+            if current.store is not None:
+                raise ReloadError("The knowledge base is served from a document store; "
+                                  "re-run ingest.py and reload instead")
+
+            added = [doc_id for doc_id in upserts if doc_id not in current.documents]
+            changed = [doc_id for doc_id in upserts if doc_id in current.documents
+                       and document_version(upserts[doc_id]) != document_version(current.documents[doc_id])]
+            removed = [doc_id for doc_id in deletions
+                       if doc_id in current.documents and doc_id not in upserts]
+
+            if added or changed or removed:
+                touched = {doc_id: upserts[doc_id] for doc_id in added + changed}
+                index = current.index.updated(touched, removed)
+                snapshot = KnowledgeSnapshot(current.version + 1, current.retriever.updated(index, touched),
+                                             documents=index.documents)
+                self._publish(snapshot, changed + removed)
+
+            return {
+                "version": self.snapshot.version,
+                "added": len(added),
+                "changed": len(changed),
+                "removed": len(removed),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+            }
+
+    def replace(self, documents):
+        """Make documents the whole knowledge base, applying only the differences."""
+        if not isinstance(documents, dict):
+            raise ReloadError('"documents" must be an object of {doc_id: document}')
+        current = self.snapshot.documents or {}
+        return self.apply(documents, [doc_id for doc_id in current if doc_id not in documents])
+
+    def reload(self):
+        """Re-read the configured source (document store or knowledge file)."""
+        self._source_mtime = self._mtime()
+        if self.store_path:
+            started = time.perf_counter()
+            with self._lock:
+                snapshot = self._store_snapshot(self.snapshot.version + 1)
+                snapshot.store.warm()
+                self._publish(snapshot, None)
+            return {
+                "version": snapshot.version,
+                "documents": snapshot.summary['total_documents'],
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+            }
+        if self.kb_file:
+            return self.replace(load_knowledge_file(self.kb_file))
+        raise ReloadError("No knowledge source configured to reload from (set QBIT_KB_FILE or QBIT_DOC_STORE)")
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            mtime = self._mtime()
+            if mtime is None or mtime == self._source_mtime:
+                continue
+            try:
+                result = self.reload()
+                print(f"🔄 Knowledge base reloaded from {self._source_path()}: {result}")
+            except Exception as e:
+                self._source_mtime = mtime  # Don't retry until the source changes again
+                print(f"⚠️ Knowledge base reload failed: {e}")
+
+    def start(self):
+        """Start background work: dense index build and the source watcher."""
+        snapshot = self.snapshot
+        if snapshot.store is not None:
+            threading.Thread(target=snapshot.store.warm, daemon=True).start()
+        snapshot.retriever.start()
+        if self.watch_interval > 0 and self._source_path():
+            self._watcher = threading.Thread(target=self._watch, name='knowledge-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
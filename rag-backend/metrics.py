@@ -0,0 +1,292 @@
+"""
+Qbit RAG Backend - Metrics
+Counters, gauges and latency histograms exposed in Prometheus text format.
+
+Request handlers open a RequestTrace per request. The trace times each stage
+of the request (parsing, retrieval, prompt assembly, generation,
+serialization) into the stage histogram and, when tracing is enabled, logs
+one structured JSON line per request under its trace ID.
+"""
+
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import config
+
+# Seconds; covers sub-millisecond retrieval up to LLM timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter read from a callback at scrape time.
+
+    The callback returns a number, or a {labelvalues tuple: number} mapping.
+    """
+
+    def __init__(self, name, help_text, callback, labelnames=(), type_name="gauge"):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+        self.type_name = type_name
+
+    def render(self):
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram of observed values."""
+
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics in registration order and renders the exposition text."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name, help_text, callback, labelnames=(), type_name="gauge"):
+        return self.register(CallbackMetric(name, help_text, callback, labelnames, type_name))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "qbit_http_requests_total", "HTTP requests served.", ("route", "method", "status"))
+HTTP_DURATION = REGISTRY.histogram(
+    "qbit_http_request_duration_seconds", "End-to-end HTTP request latency.", ("route",))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "qbit_http_in_flight_requests", "HTTP requests currently being served.", ("route",))
+STAGE_DURATION = REGISTRY.histogram(
+    "qbit_stage_duration_seconds", "Latency of each request stage.", ("route", "stage"))
+CHAT_ANSWERS = REGISTRY.counter(
+    "qbit_chat_answers_total", "Chat answers by the path that produced them (extractive, llm, cache, fallback).", ("path",))
+PROMPT_TOKENS = REGISTRY.histogram(
+    "qbit_prompt_tokens", "Estimated tokens in each chat prompt sent to Ollama.",
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 4096))
+LLM_COALESCED = REGISTRY.counter(
+    "qbit_llm_coalesced_total", "Chat generations shared with an identical one already in flight.")
+BATCH_ITEMS = REGISTRY.counter(
+    "qbit_batch_items_total", "Messages answered through /api/chat/batch, by mode (full, retrieval, extractive).", ("mode",))
+OLLAMA_REQUESTS = REGISTRY.counter(
+    "qbit_ollama_requests_total",
+    "Ollama calls by outcome (success, error, timeout, shed, circuit_open).", ("outcome",))
+OLLAMA_HEDGES = REGISTRY.counter(
+    "qbit_ollama_hedged_requests_total", "Hedged Ollama calls by which copy answered first (primary, hedge).", ("winner",))
+OLLAMA_DURATION = REGISTRY.histogram(
+    "qbit_ollama_request_duration_seconds", "Wall-clock latency of Ollama calls.")
+OLLAMA_TOKENS = REGISTRY.counter(
+    "qbit_ollama_tokens_total", "Tokens processed by Ollama (prompt = prefill, completion = eval).", ("kind",))
+OLLAMA_EVAL_SECONDS = REGISTRY.counter(
+    "qbit_ollama_eval_seconds_total", "Time Ollama reported spending per phase (prompt = prefill, completion = eval).", ("kind",))
+
+
+def record_ollama_usage(data):
+    """Count tokens and eval time from a finished /api/generate response."""
+    if 'prompt_eval_count' in data:
+        OLLAMA_TOKENS.inc(data['prompt_eval_count'], kind="prompt")
+    if 'eval_count' in data:
+        OLLAMA_TOKENS.inc(data['eval_count'], kind="completion")
+    if 'prompt_eval_duration' in data:
+        OLLAMA_EVAL_SECONDS.inc(data['prompt_eval_duration'] / 1e9, kind="prompt")
+    if 'eval_duration' in data:
+        OLLAMA_EVAL_SECONDS.inc(data['eval_duration'] / 1e9, kind="completion")
+
+
+class StageTimer:
+    """Stage timings and extra fields for one unit of work on a route, such
+    as one message of a batch request."""
+
+    def __init__(self, route):
+        self.route = route
+        self.stages = {}
+        self.fields = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as one stage of this request."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            STAGE_DURATION.observe(elapsed, route=self.route, stage=name)
+
+    def annotate(self, **fields):
+        """Attach extra fields to the trace log line."""
+        self.fields.update(fields)
+
+
+class RequestTrace(StageTimer):
+    """Per-request stage timings, reported to the histograms and the trace log."""
+
+    def __init__(self, route, method, trace_id=None, log=None):
+        super().__init__(route)
+        self.method = method
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.log = config.TRACE_LOG if log is None else log
+        self.status = None
+        self.started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route=route)
+
+    def finish(self, status):
+        """Record the request's outcome; returns its total duration in seconds."""
+        elapsed = time.perf_counter() - self.started
+        HTTP_IN_FLIGHT.dec(route=self.route)
+        HTTP_REQUESTS.inc(route=self.route, method=self.method, status=status or 0)
+        HTTP_DURATION.observe(elapsed, route=self.route)
+
+        if self.log:
+            entry = {
+                "trace_id": self.trace_id,
+                "method": self.method,
+                "route": self.route,
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 3),
+                "stages_ms": {name: round(value * 1000, 3) for name, value in self.stages.items()}
+            }
+            entry.update(self.fields)
+            print(json.dumps(entry), flush=True)
+        return elapsed
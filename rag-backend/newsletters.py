@@ -0,0 +1,241 @@
+"""
+Qbit RAG Backend - Newsletters
+AI-generated newsletter entries, precomputed in the background.
+
+Newsletter content only needs to change a few times a day, so a scheduler
+regenerates a batch on an interval (one Ollama call per topic, in parallel)
+and /api/newsletters serves the latest batch straight from memory.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import config
+from admission import Unavailable
+from ollama_client import OllamaError
+from ollama_pool import get_client
+
+# Always generate these two specific types - AI/Software + Electronics/DFT
+NEWSLETTER_TOPICS = [
+    {
+        "topic": "Latest AI and Software Engineering trends and breakthroughs",
+        "category": "AI & Software Engineering"
+    },
+    {
+        "topic": "Electronics hardware development and Design for Testability (DFT) methodologies",
+        "category": "Electronics & DFT"
+    }
+]
+
+
+def utc_timestamp():
+    """Current UTC time in the API's ISO-8601 format."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def build_newsletter_prompt(topic):
+    """Create prompt for newsletter generation."""
+    return f"""Create a newsletter entry about: {topic}
+
+STRICT FORMAT - respond with EXACTLY this format:
+Title: [write your engaging title here - max 8 words]
+Description: [write your description here - max 120 characters]
+
+Requirements:
+- Make title engaging and specific to recent trends
+- Keep description under 120 characters
+- Focus on practical applications and latest developments
+
+Topic: {topic}"""
+
+
+def generate_newsletter(topic_data):
+    """Generate one newsletter entry with Ollama.
+
+    Returns (newsletter, generated) where generated is False when the
+    fallback entry had to be used.
+    """
+    topic = topic_data["topic"]
+    category = topic_data["category"]
+
+    try:
+        # Call Ollama API
+        result = get_client().generate(build_newsletter_prompt(topic),
+                                       timeout=config.OLLAMA_NEWSLETTER_TIMEOUT)
+        ai_content = result.response
+        print(f"🤖 AI Response for {category} ({result.elapsed:.2f}s): {ai_content}")
+
+        # Parse AI response
+        newsletter = parse_newsletter_response(ai_content, category)
+        print(f"📝 Parsed Newsletter: {newsletter}")
+        return newsletter, True
+
+    except (OllamaError, Unavailable) as e:
+        print(f"❌ {e}")
+    except Exception as e:
+        print(f"Error generating newsletter: {e}")
+
+    # Fallback if Ollama fails
+    return create_fallback_newsletter(category), False
+
+
+def newsletter_topics(count):
+    """Pick count topics, cycling through NEWSLETTER_TOPICS."""
+    return [NEWSLETTER_TOPICS[i % len(NEWSLETTER_TOPICS)] for i in range(max(count, 0))]
+
+
+def generate_newsletters(count=2):
+    """Generate count newsletters, one Ollama call per topic in parallel.
+
+    Returns (newsletters, generated) where generated[i] is False when entry
+    i is a fallback.
+    """
+    topics = newsletter_topics(count)
+    if not topics:
+        return [], []
+
+    with ThreadPoolExecutor(max_workers=len(topics), thread_name_prefix='qbit-newsletter') as executor:
+        results = list(executor.map(generate_newsletter, topics))
+
+    newsletters = [newsletter for newsletter, _ in results]
+    generated = [generated for _, generated in results]
+    return newsletters, generated
+
+
+def parse_newsletter_response(ai_content, category):
+    """Parse AI response into newsletter format."""
+    lines = ai_content.strip().split('\n')
+
+    title = "Tech Update"
+    description = "Latest technology updates."
+
+    for line in lines:
+        line = line.strip()
+        # Handle various title formats
+        if any(prefix in line.lower() for prefix in ['title:', '**title:**', 'title']):
+            # Extract title - remove markdown, quotes, and prefixes
+            title_text = line
+            title_text = title_text.replace('**Title:**', '').replace('Title:', '')
+            title_text = title_text.replace('**title:**', '').replace('title:', '')
+            title_text = title_text.replace('"', '').replace("'", '').strip()
+            if title_text and len(title_text) > 3:  # Valid title
+                title = title_text
+
+        # Handle various description formats
+        elif any(prefix in line.lower() for prefix in ['description:', '**description:**', 'description']):
+            # Extract description - remove markdown, quotes, and prefixes
+            desc_text = line
+            desc_text = desc_text.replace('**Description:**', '').replace('Description:', '')
+            desc_text = desc_text.replace('**description:**', '').replace('description:', '')
+            desc_text = desc_text.replace('"', '').replace("'", '').strip()
+            if desc_text and len(desc_text) > 10:  # Valid description
+                description = desc_text
+
+    # Fallback: if we didn't find proper title/description, try to extract from content
+    if title == "Tech Update" or description == "Latest technology updates.":
+        content = ai_content.lower()
+        if 'ai' in content or 'software' in content:
+            title = "AI & Software Engineering News"
+            description = "Latest AI and software development innovations and trends."
+        elif 'electronics' in content or 'dft' in content or 'hardware' in content:
+            title = "Electronics & DFT Updates"
+            description = "Hardware design and Design for Testability advancements."
+
+    return {
+        "title": title,
+        "description": description,
+        "category": category
+    }
+
+
+def create_fallback_newsletter(category):
+    """Create fallback newsletter if AI fails."""
+    fallback_map = {
+        "AI & Software Engineering": {
+            "title": "AI & Software Engineering Update",
+            "description": "Latest developments in AI and modern software practices.",
+            "category": "AI & Software Engineering"
+        },
+        "Electronics & DFT": {
+            "title": "Electronics & DFT Innovations",
+            "description": "Hardware design trends and Design for Testability advances.",
+            "category": "Electronics & DFT"
+        }
+    }
+
+    return fallback_map.get(category, {
+        "title": "Technology Update",
+        "description": "Latest technology trends and innovations.",
+        "category": "Technology"
+    })
+
+
+class NewsletterScheduler:
+    """Regenerates the newsletter batch on an interval and serves the latest one."""
+
+    def __init__(self, interval, batch_size=2, generate=generate_newsletters, retry_interval=60.0):
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.batch_size = batch_size
+        self.generate = generate
+        self._batch = None  # (newsletters, generated_at)
+        self._generated = []  # Whether each entry of the batch came from the LLM
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def latest(self):
+        """Return (newsletters, generated_at) for the newest batch, or None."""
+        return self._batch
+
+    def refresh(self):
+        """Generate a new batch now; skipped if a refresh is already running.
+
+        Fallbacks never replace previously generated entries: a topic whose
+        regeneration failed keeps its previous AI entry, and a refresh that
+        produced no AI content at all is dropped, keeping the previous batch
+        (or none, so callers keep serving their marked fallback).
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            started = time.perf_counter()
+            newsletters, generated = self.generate(self.batch_size)
+            if not any(generated):
+                print("⚠️ Newsletter refresh produced no AI content, keeping previous batch")
+                return False
+
+            # Topics are assigned by position, so entry i is the same topic in both batches
+            newsletters, generated = list(newsletters), list(generated)
+            previous = self._batch[0] if self._batch is not None else []
+            for i, fresh in enumerate(generated):
+                if not fresh and i < len(previous) and self._generated[i]:
+                    newsletters[i] = previous[i]
+                    generated[i] = True
+                    print(f"⚠️ Keeping previous newsletter for {previous[i].get('category')}")
+            self._batch = (newsletters, utc_timestamp())
+            self._generated = generated
+            print(f"📰 Newsletters refreshed in {time.perf_counter() - started:.2f}s")
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing newsletters: {e}")
+            # Until a first AI batch exists, retry soon rather than a whole interval later
+            self._stop.wait(self.interval if self._batch is not None else self.retry_interval)
+
+    def start(self):
+        """Start refreshing in a background thread (first refresh runs immediately)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='qbit-newsletter-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
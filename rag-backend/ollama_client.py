@@ -0,0 +1,212 @@
+"""
+Qbit RAG Backend - Ollama Client
+Connection-pooled client for one Ollama server's HTTP API.
+
+All generation goes through a single requests.Session, so TCP connections to
+Ollama are kept alive and reused across requests instead of being opened and
+torn down per call. The pool size, timeouts, retry policy, model and model
+options come from config. Calls can also pass through an admission
+controller and circuit breaker from admission.py, so an overloaded or failing
+Ollama is refused quickly instead of tying up request threads. The backend
+uses one client per server through OllamaPool (ollama_pool.py).
+"""
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from admission import CircuitOpen, Overloaded
+from metrics import OLLAMA_DURATION, OLLAMA_REQUESTS, record_ollama_usage
+
+
+class OllamaError(Exception):
+    """Raised when Ollama answers with a non-200 status."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OllamaResult:
+    """A completed /api/generate call plus its timing."""
+
+    def __init__(self, data, elapsed, host=None):
+        self.data = data
+        self.elapsed = elapsed  # Wall-clock seconds, including queueing in Ollama
+        self.host = host  # Server that answered
+
+    @property
+    def response(self):
+        return self.data.get('response', '')
+
+    @property
+    def timings(self):
+        """Wall-clock and Ollama-reported durations in seconds."""
+        timings = {"elapsed": self.elapsed}
+        for key in ('total_duration', 'load_duration', 'prompt_eval_duration', 'eval_duration'):
+            if key in self.data:
+                timings[key.replace('_duration', '')] = self.data[key] / 1e9
+        return timings
+
+
+class OllamaClient:
+    """Pooled, keep-alive client for a single Ollama server."""
+
+    def __init__(self, host=None, model=None, options=None, pool_size=None,
+                 retries=None, backoff=None, connect_timeout=None,
+                 admission=None, breaker=None):
+        self.admission = admission
+        self.breaker = breaker
+        self.host = (host or config.OLLAMA_HOST).rstrip('/')
+        self.model = model or config.OLLAMA_MODEL
+        self.options = dict(config.OLLAMA_OPTIONS if options is None else options)
+        self.connect_timeout = config.OLLAMA_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+
+        pool_size = config.OLLAMA_POOL_SIZE if pool_size is None else pool_size
+        retries = config.OLLAMA_RETRIES if retries is None else retries
+        backoff = config.OLLAMA_BACKOFF if backoff is None else backoff
+
+        # Retry connection failures and overload statuses with exponential
+        # backoff; never retry a read timeout, which would double the wait
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'POST']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=retry, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @contextmanager
+    def _guard(self):
+        """Apply the circuit breaker and admission limit around one call."""
+        if self.breaker is not None:
+            try:
+                self.breaker.before_call()
+            except CircuitOpen:
+                OLLAMA_REQUESTS.inc(outcome="circuit_open")
+                raise
+        outcome = None
+        started = None
+        try:
+            with self.admission.admit() if self.admission is not None else nullcontext():
+                started = time.perf_counter()
+                yield
+            outcome = "success"
+        except Overloaded:
+            outcome = "shed"
+            raise
+        except requests.Timeout:
+            outcome = "timeout"
+            raise
+        except (OllamaError, requests.RequestException):
+            outcome = "error"
+            raise
+        finally:
+            if self.breaker is not None:
+                if outcome == "success":
+                    self.breaker.record_success()
+                elif outcome in ("error", "timeout"):
+                    self.breaker.record_failure()
+                else:
+                    # Shed or abandoned (e.g. client disconnected mid-stream)
+                    self.breaker.release_probe()
+            if outcome is not None:
+                OLLAMA_REQUESTS.inc(outcome=outcome)
+            if started is not None:
+                OLLAMA_DURATION.observe(time.perf_counter() - started)
+
+    def _payload(self, prompt, stream, options, extra):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream
+        }
+        merged_options = dict(self.options, **(options or {}))
+        if merged_options:
+            payload["options"] = merged_options
+        payload.update(extra)
+        return payload
+
+    def generate(self, prompt, timeout, options=None, **extra):
+        """Run a non-streaming /api/generate call and return an OllamaResult."""
+        with self._guard():
+            started = time.perf_counter()
+            response = self.session.post(
+                f"{self.host}/api/generate",
+                json=self._payload(prompt, False, options, extra),
+                timeout=(self.connect_timeout, timeout)
+            )
+            if response.status_code != 200:
+                raise OllamaError(f"Ollama API error: {response.status_code}", response.status_code)
+            result = OllamaResult(response.json(), time.perf_counter() - started, self.host)
+            record_ollama_usage(result.data)
+            return result
+
+    def generate_stream(self, prompt, timeout, options=None, **extra):
+        """Yield /api/generate chunks as Ollama produces them.
+
+        The final chunk (done=True) carries Ollama's durations and gets extra
+        'elapsed' (wall-clock time of the whole call) and 'host' keys.
+        """
+        with self._guard():
+            started = time.perf_counter()
+            with self.session.post(
+                f"{self.host}/api/generate",
+                json=self._payload(prompt, True, options, extra),
+                timeout=(self.connect_timeout, timeout),
+                stream=True
+            ) as response:
+                if response.status_code != 200:
+                    raise OllamaError(f"Ollama API error: {response.status_code}", response.status_code)
+
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('done'):
+                        chunk['elapsed'] = time.perf_counter() - started
+                        chunk['host'] = self.host
+                        record_ollama_usage(chunk)
+                        yield chunk
+                        return
+                    yield chunk
+
+    def embed(self, texts, model=None, timeout=None):
+        """Return one embedding per text from /api/embed.
+
+        Embedding calls are short and feed retrieval rather than generation,
+        so they skip the admission queue and circuit breaker; callers fall
+        back to keyword search on failure.
+        """
+        response = self.session.post(
+            f"{self.host}/api/embed",
+            json={"model": model or config.OLLAMA_EMBED_MODEL, "input": list(texts)},
+            timeout=(self.connect_timeout, config.OLLAMA_EMBED_TIMEOUT if timeout is None else timeout)
+        )
+        if response.status_code != 200:
+            raise OllamaError(f"Ollama embed API error: {response.status_code}", response.status_code)
+        return response.json()['embeddings']
+    
+    def stats(self):
+        """Queue depth, shed counts and breaker state."""
+        return {
+            "admission": self.admission.stats() if self.admission is not None else None,
+            "circuit_breaker": self.breaker.stats() if self.breaker is not None else None
+        }
+
+    def close(self):
+        self.session.close()
+
@@ -0,0 +1,449 @@
+"""
+Qbit RAG Backend - Ollama Pool
+Spreads LLM calls over one or more Ollama servers (OLLAMA_HOSTS).
+
+Each endpoint has its own keep-alive OllamaClient and circuit breaker, and
+every call goes to the available endpoint with the fewest outstanding
+requests. A health checker polls each endpoint's /api/tags: an endpoint that
+fails OLLAMA_EJECT_FAILURES checks in a row is ejected from routing until a
+check succeeds again, and one whose breaker opens after failed calls is
+skipped until the breaker lets a probe through. If every endpoint is
+ejected, calls are tried anyway rather than refused outright. Admission
+control covers the whole pool, with OLLAMA_MAX_IN_FLIGHT slots per healthy
+endpoint.
+
+With OLLAMA_HEDGE_PERCENTILE set, a call still waiting for its first output
+after that percentile of recent calls is duplicated on a second endpoint
+that has an idle slot, and whichever answers first wins; the other is
+abandoned.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+
+import config
+from admission import AdmissionController, CircuitBreaker, CircuitOpen, Overloaded
+from metrics import OLLAMA_HEDGES, OLLAMA_REQUESTS
+from ollama_client import OllamaClient
+
+# An endpoint the conversation used before is kept if it has at most this many
+# more outstanding calls than the least loaded one
+AFFINITY_SLACK = 1
+
+# Latency samples kept, and needed, before hedging starts
+HEDGE_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+
+_DONE = object()
+
+
+def parse_hosts(value):
+    """Split a comma-separated OLLAMA_HOSTS value into base URLs."""
+    return [host.strip().rstrip('/') for host in value.split(',') if host.strip()]
+
+
+class Endpoint:
+    """One Ollama server in the pool."""
+
+    def __init__(self, client, max_in_flight):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.outstanding = 0
+        self.healthy = True
+        self.failed_checks = 0
+        self.last_error = None
+        self.requests = 0
+
+    @property
+    def host(self):
+        return self.client.host
+
+    @property
+    def breaker(self):
+        return self.client.breaker
+
+    @property
+    def available(self):
+        return self.healthy and self.breaker.allows_call()
+
+    def stats(self):
+        return {
+            "host": self.host,
+            "available": self.available,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "last_error": self.last_error,
+            "circuit_breaker": self.breaker.stats()
+        }
+
+
+class LatencyWindow:
+    """Recent call latencies, for the hedging delay."""
+
+    def __init__(self, size=HEDGE_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            values = sorted(self._samples)
+        return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+class _Attempt:
+    """One copy of a (possibly hedged) streaming call."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.cancelled = False
+
+
+class OllamaPool:
+    """Least-outstanding-requests router over Ollama endpoints."""
+
+    def __init__(self, hosts, model=None, max_in_flight=None, max_queue=None, max_queue_wait=None,
+                 breaker_failures=None, breaker_reset=None, health_interval=None,
+                 eject_failures=None, hedge_percentile=None):
+        self.max_in_flight = config.OLLAMA_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight
+        self.health_interval = config.OLLAMA_HEALTH_INTERVAL if health_interval is None else health_interval
+        self.eject_failures = config.OLLAMA_EJECT_FAILURES if eject_failures is None else eject_failures
+        self.hedge_percentile = config.OLLAMA_HEDGE_PERCENTILE if hedge_percentile is None else hedge_percentile
+        breaker_failures = config.OLLAMA_BREAKER_FAILURES if breaker_failures is None else breaker_failures
+        breaker_reset = config.OLLAMA_BREAKER_RESET if breaker_reset is None else breaker_reset
+
+        self.endpoints = [
+            Endpoint(OllamaClient(host=host, model=model,
+                                  breaker=CircuitBreaker(breaker_failures, breaker_reset)),
+                     self.max_in_flight)
+            for host in hosts
+        ]
+        self.model = self.endpoints[0].client.model
+        self.admission = AdmissionController(
+            max_in_flight=self.max_in_flight * len(self.endpoints),
+            max_queue=config.OLLAMA_MAX_QUEUE if max_queue is None else max_queue,
+            max_queue_wait=config.OLLAMA_MAX_QUEUE_WAIT if max_queue_wait is None else max_queue_wait
+        )
+        self._lock = threading.Lock()
+        self._next = 0  # Rotates ties between equally loaded endpoints
+        self._stop = threading.Event()
+        self._checker = None
+        self.latency = {"generate": LatencyWindow(), "stream": LatencyWindow()}
+        self.hedged = 0
+
+    # Routing
+
+    def _pick(self, exclude=(), affinity=None, idle_only=False):
+        """Reserve the least loaded usable endpoint, or return None."""
+        with self._lock:
+            if any(e.healthy for e in self.endpoints):
+                candidates = [e for e in self.endpoints if e not in exclude and e.available]
+            else:
+                # Every endpoint failed its health checks: try them anyway
+                candidates = [e for e in self.endpoints if e not in exclude and e.breaker.allows_call()]
+            if idle_only:
+                candidates = [e for e in candidates if e.outstanding < e.max_in_flight]
+            if not candidates:
+                return None
+
+            start = self._next % len(candidates)
+            self._next += 1
+            rotated = candidates[start:] + candidates[:start]
+            endpoint = min(rotated, key=lambda e: e.outstanding)
+            if affinity is not None:
+                preferred = next((e for e in candidates if e.host == affinity), None)
+                if preferred is not None and preferred.outstanding <= endpoint.outstanding + AFFINITY_SLACK:
+                    endpoint = preferred
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint):
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def _reserve(self, exclude=(), affinity=None):
+        endpoint = self._pick(exclude, affinity)
+        if endpoint is None:
+            OLLAMA_REQUESTS.inc(outcome="circuit_open")
+            raise CircuitOpen("No Ollama endpoint is available")
+        return endpoint
+
+    @contextmanager
+    def _endpoint(self, exclude=(), affinity=None):
+        endpoint = self._reserve(exclude, affinity)
+        try:
+            yield endpoint
+        finally:
+            self._release(endpoint)
+
+    @contextmanager
+    def _admit(self):
+        """Hold a pool-wide LLM slot, counting calls that are shed."""
+        try:
+            with self.admission.admit():
+                yield
+        except Overloaded:
+            OLLAMA_REQUESTS.inc(outcome="shed")
+            raise
+
+    def _failover(self, call, affinity=None):
+        """Run call(endpoint), moving on to another endpoint if one is refused
+        by its breaker or can't be reached."""
+        tried = []
+        while True:
+            with self._endpoint(tried, affinity) as endpoint:
+                try:
+                    return call(endpoint)
+                except (CircuitOpen, requests.ConnectionError):
+                    tried.append(endpoint)
+                    if len(tried) >= len(self.endpoints):
+                        raise
+
+    def _hedge_delay(self, kind):
+        if self.hedge_percentile <= 0 or len(self.endpoints) < 2:
+            return None
+        return self.latency[kind].percentile(self.hedge_percentile)
+
+    # Calls
+
+    def generate(self, prompt, timeout, options=None, affinity=None, **extra):
+        """Run a non-streaming /api/generate call on the pool; returns an OllamaResult."""
+        with self._admit():
+            delay = self._hedge_delay("generate")
+            if delay is None:
+                result = self._failover(
+                    lambda endpoint: endpoint.client.generate(prompt, timeout, options, **extra), affinity)
+            else:
+                result = self._hedged_generate(delay, prompt, timeout, options, affinity, extra)
+        self.latency["generate"].add(result.elapsed)
+        return result
+
+    def _hedged_generate(self, delay, prompt, timeout, options, affinity, extra):
+        results = queue.Queue()
+
+        def attempt(endpoint):
+            try:
+                results.put((endpoint, endpoint.client.generate(prompt, timeout, options, **extra)))
+            except Exception as e:
+                results.put((endpoint, e))
+            finally:
+                self._release(endpoint)
+
+        primary = self._reserve(affinity=affinity)
+        threading.Thread(target=attempt, args=(primary,), daemon=True).start()
+        pending = 1
+        try:
+            endpoint, outcome = results.get(timeout=delay)
+        except queue.Empty:
+            hedge = self._pick(exclude=(primary,), idle_only=True)
+            if hedge is not None:
+                threading.Thread(target=attempt, args=(hedge,), daemon=True).start()
+                pending += 1
+                self.hedged += 1
+            endpoint, outcome = results.get()
+
+        # Take the first success; only fail once every copy has failed
+        while isinstance(outcome, Exception) and pending > 1:
+            pending -= 1
+            endpoint, outcome = results.get()
+        if isinstance(outcome, Exception):
+            raise outcome
+        if pending > 1:
+            OLLAMA_HEDGES.inc(winner="hedge" if endpoint is not primary else "primary")
+        return outcome
+
+    def generate_stream(self, prompt, timeout, options=None, affinity=None, **extra):
+        """Yield /api/generate chunks from the pool (see OllamaClient.generate_stream)."""
+        with self._admit():
+            started = time.perf_counter()
+            delay = self._hedge_delay("stream")
+            if delay is None:
+                chunks = self._failover_stream(prompt, timeout, options, affinity, extra)
+            else:
+                chunks = self._hedged_stream(delay, prompt, timeout, options, affinity, extra)
+            try:
+                first = True
+                for chunk in chunks:
+                    if first:
+                        self.latency["stream"].add(time.perf_counter() - started)
+                        first = False
+                    yield chunk
+            finally:
+                chunks.close()
+
+    def _failover_stream(self, prompt, timeout, options, affinity, extra):
+        tried = []
+        while True:
+            with self._endpoint(tried, affinity) as endpoint:
+                produced = False
+                try:
+                    for chunk in endpoint.client.generate_stream(prompt, timeout, options, **extra):
+                        produced = True
+                        yield chunk
+                    return
+                except (CircuitOpen, requests.ConnectionError):
+                    tried.append(endpoint)
+                    if produced or len(tried) >= len(self.endpoints):
+                        raise
+
+    def _hedged_stream(self, delay, prompt, timeout, options, affinity, extra):
+        chunks = queue.Queue()
+
+        def relay(attempt):
+            try:
+                stream = attempt.endpoint.client.generate_stream(prompt, timeout, options, **extra)
+                try:
+                    for chunk in stream:
+                        if attempt.cancelled:
+                            break
+                        chunks.put((attempt, chunk))
+                finally:
+                    # Closing the response makes Ollama stop generating
+                    stream.close()
+                chunks.put((attempt, _DONE))
+            except Exception as e:
+                chunks.put((attempt, e))
+            finally:
+                self._release(attempt.endpoint)
+
+        def launch(endpoint):
+            attempt = _Attempt(endpoint)
+            attempts.append(attempt)
+            threading.Thread(target=relay, args=(attempt,), daemon=True).start()
+
+        attempts = []
+        primary = self._reserve(affinity=affinity)
+        launch(primary)
+
+        winner = None
+        failed = 0
+        try:
+            # Wait for the first copy to produce output, hedging once if slow
+            while winner is None:
+                try:
+                    attempt, item = chunks.get(timeout=delay if len(attempts) == 1 else None)
+                except queue.Empty:
+                    hedge = self._pick(exclude=(primary,), idle_only=True)
+                    if hedge is not None:
+                        launch(hedge)
+                        self.hedged += 1
+                    delay = None
+                    continue
+                if isinstance(item, Exception) or item is _DONE:
+                    failed += 1
+                    if failed < len(attempts):
+                        continue
+                    if isinstance(item, Exception):
+                        raise item
+                    return
+                winner = attempt
+                if len(attempts) > 1:
+                    OLLAMA_HEDGES.inc(winner="hedge" if attempt is not attempts[0] else "primary")
+                for other in attempts:
+                    other.cancelled = other is not winner
+                yield item
+
+            while True:
+                attempt, item = chunks.get()
+                if attempt is not winner:
+                    continue
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for attempt in attempts:
+                attempt.cancelled = True
+
+    def embed(self, texts, model=None, timeout=None):
+        """Return one embedding per text from the least loaded endpoint."""
+        return self._failover(lambda endpoint: endpoint.client.embed(texts, model=model, timeout=timeout))
+
+    # Health
+
+    def check(self, endpoint):
+        """Poll one endpoint's /api/tags and eject or re-admit it."""
+        try:
+            response = requests.get(f"{endpoint.host}/api/tags", timeout=config.OLLAMA_CONNECT_TIMEOUT)
+            if response.status_code != 200:
+                raise requests.RequestException(f"HTTP {response.status_code}")
+            names = {model.get('name') for model in response.json().get('models', [])}
+            if self.model not in names and f"{self.model}:latest" not in names:
+                raise requests.RequestException(f"model {self.model} is not pulled")
+        except (requests.RequestException, ValueError) as e:
+            endpoint.failed_checks += 1
+            endpoint.last_error = str(e)
+            if endpoint.healthy and endpoint.failed_checks >= self.eject_failures:
+                endpoint.healthy = False
+                print(f"⚠️ Ejected Ollama endpoint {endpoint.host}: {e}")
+                self._resize()
+            return False
+
+        endpoint.failed_checks = 0
+        endpoint.last_error = None
+        if not endpoint.healthy:
+            endpoint.healthy = True
+            print(f"✅ Re-admitted Ollama endpoint {endpoint.host}")
+            self._resize()
+        return True
+
+    def _resize(self):
+        """Scale the pool's admission slots with the number of healthy endpoints."""
+        healthy = sum(1 for endpoint in self.endpoints if endpoint.healthy)
+        self.admission.resize(self.max_in_flight * max(healthy, 1))
+
+    def _check_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for endpoint in self.endpoints:
+                self.check(endpoint)
+
+    def start(self):
+        """Start the background health checker."""
+        if self.health_interval > 0 and self._checker is None:
+            self._checker = threading.Thread(target=self._check_loop, name='ollama-health', daemon=True)
+            self._checker.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._checker is not None:
+            self._checker.join(timeout=5)
+
+    def stats(self):
+        """Admission state, hedging and per-endpoint load and health."""
+        return {
+            "admission": self.admission.stats(),
+            "hedged": self.hedged,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints]
+        }
+
+    def close(self):
+        self.stop()
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide OllamaPool over OLLAMA_HOSTS (or OLLAMA_HOST)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaPool(parse_hosts(config.OLLAMA_HOSTS or config.OLLAMA_HOST))
+    return _client
@@ -4,12 +4,36 @@ Qbit RAG Backend - Ollama Powered
 Simple HTTP server with real AI using Ollama Llama 3.1
 """
 
+import copy
+import hmac
+import itertools
 import json
+import signal
+import threading
+import time
 import uuid
-import requests
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
+import config
+from admission import Unavailable
+from answer_cache import create_answer_cache
+from batch import batch_options, iter_ndjson, parse_batch, run_bounded
+from coalescing import MicroBatcher, SingleFlight
+from extractive import extract_answer
+from knowledge import KnowledgeBase, ReloadError
+from metrics import BATCH_ITEMS, CHAT_ANSWERS, PROMPT_TOKENS, REGISTRY, RequestTrace, StageTimer
+from newsletters import (NewsletterScheduler, create_fallback_newsletter,
+                         newsletter_topics, utc_timestamp)
+from ollama_client import OllamaError
+from ollama_pool import get_client
+from prompts import build_chat_prompt, build_followup_prompt
+from responses import ResponseCache, accepts_gzip, compress, etag_matches
+from server import QbitHTTPServer
+from sessions import conversation_id_from, create_session_store
+
 # Knowledge base - same as before
 KNOWLEDGE_BASE = {
     "leave_policy": {
@@ -49,163 +73,623 @@ KNOWLEDGE_BASE = {
     }
 }
 
+# Generated answers keyed on question + retrieved document versions
+ANSWER_CACHE = create_answer_cache()
+
+# Conversation history and Ollama context tokens, keyed by conversation_id
+SESSIONS = create_session_store()
+
+# Identical concurrent prompts share one generation; new generations can be
+# held briefly and submitted together, one batch per round of Ollama slots
+FLIGHTS = SingleFlight(
+    MicroBatcher(config.LLM_BATCH_WINDOW, lambda: get_client().admission.max_in_flight)
+    if config.LLM_BATCH_WINDOW > 0 else None
+)
+
+
+def invalidate_answers(snapshot, changed_ids):
+    """Drop cached answers and conversation contexts built from documents a
+    reload changed or removed."""
+    if changed_ids is None:
+        ANSWER_CACHE.clear()
+    else:
+        ANSWER_CACHE.invalidate_documents(changed_ids)
+    SESSIONS.invalidate_documents(changed_ids)
+
+
+# Versioned knowledge snapshots: the search index is memory-mapped from an
+# ingested document store when one is configured, otherwise built from the
+# knowledge file or the built-in dict, and hot-reloaded in place
+KNOWLEDGE = KnowledgeBase(KNOWLEDGE_BASE, store_path=config.DOC_STORE, kb_file=config.KB_FILE,
+                          watch_interval=config.KB_WATCH_INTERVAL, on_change=invalidate_answers)
+
+# Newsletters are regenerated in the background and served from memory
+NEWSLETTER_SCHEDULER = NewsletterScheduler(config.NEWSLETTER_REFRESH_INTERVAL,
+                                           batch_size=config.NEWSLETTER_BATCH_SIZE,
+                                           retry_interval=config.NEWSLETTER_RETRY_INTERVAL)
+
+# Bodies of / and /api/knowledge, rebuilt when the knowledge version changes
+RESPONSES = ResponseCache()
+
+# /health fields that never change; the live stats are added per request
+HEALTH_METADATA = {
+    "status": "healthy",
+    "ai_backend": "Ollama Llama 3.1",
+    "cost": "$0 (completely free)",
+    "timestamp": "2025-09-17T18:57:00Z"
+}
+
+# Longest chunk-size line accepted in a chunked request body
+MAX_CHUNK_LINE = 1024
+
+HOME_PAGE = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Qbit RAG Backend API</title>
+        </head>
+        <body>
+            <h1>Qbit RAG Backend API</h1>
+            
+            <h2>Available Endpoints:</h2>
+            
+            <p><strong>GET</strong> /health - Health check and system status</p>
+            <p><strong>POST</strong> /api/chat - Chat with AI assistant</p>
+            <p><strong>POST</strong> /api/chat/batch - Answer many messages, streamed back as NDJSON</p>
+            <p><strong>GET</strong> /api/knowledge - Get knowledge base information</p>
+            <p><strong>POST</strong> /api/newsletters - Generate AI-powered newsletters</p>
+            <p><strong>GET</strong> /metrics - Prometheus metrics</p>
+            
+        </body>
+        </html>
+        """
+
+# Routes get their own metric labels; anything else is reported as "other"
+TRACED_ROUTES = {'/', '/health', '/metrics', '/api/knowledge', '/api/chat', '/api/chat/batch',
+                 '/api/newsletters', '/admin/reload'}
+
+REGISTRY.callback("qbit_answer_cache_entries", "Answers currently cached.",
+                  lambda: ANSWER_CACHE.stats()["entries"])
+REGISTRY.callback("qbit_answer_cache_bytes", "Approximate memory held by cached answers.",
+                  lambda: ANSWER_CACHE.stats()["bytes"])
+REGISTRY.callback("qbit_answer_cache_hits_total", "Answer cache hits.",
+                  lambda: ANSWER_CACHE.hits, type_name="counter")
+REGISTRY.callback("qbit_answer_cache_misses_total", "Answer cache misses.",
+                  lambda: ANSWER_CACHE.misses, type_name="counter")
+REGISTRY.callback("qbit_sessions", "Conversations currently remembered.",
+                  lambda: SESSIONS.stats()["sessions"])
+REGISTRY.callback("qbit_session_bytes", "Approximate memory held by conversation sessions.",
+                  lambda: SESSIONS.stats()["bytes"])
+REGISTRY.callback("qbit_knowledge_version", "Version of the active knowledge snapshot.",
+                  lambda: KNOWLEDGE.snapshot.version)
+REGISTRY.callback("qbit_ollama_in_flight", "Ollama calls currently running.",
+                  lambda: get_client().admission.in_flight)
+REGISTRY.callback("qbit_ollama_queue_depth", "Ollama calls waiting for a slot.",
+                  lambda: get_client().admission.queued)
+REGISTRY.callback("qbit_ollama_circuit_open", "1 while an Ollama server's circuit breaker is not closed.",
+                  lambda: {(e.host,): int(e.breaker.state != "closed") for e in get_client().endpoints},
+                  labelnames=("endpoint",))
+REGISTRY.callback("qbit_ollama_endpoint_healthy", "1 while an Ollama server passes its health checks.",
+                  lambda: {(e.host,): int(e.healthy) for e in get_client().endpoints},
+                  labelnames=("endpoint",))
+REGISTRY.callback("qbit_ollama_endpoint_outstanding", "Calls currently routed to each Ollama server.",
+                  lambda: {(e.host,): e.outstanding for e in get_client().endpoints},
+                  labelnames=("endpoint",))
+
 class OllamaRAGHandler(BaseHTTPRequestHandler):
+    # Persistent connections: every response carries a Content-Length or is chunked
+    protocol_version = 'HTTP/1.1'
+    timeout = config.KEEPALIVE_TIMEOUT or None
+    disable_nagle_algorithm = True
+    
+    trace = None
+    status_code = None
+    snapshot = None
+    answered_by = None
+    session = None
+    ollama_context = None
+    ollama_host = None
+    prompt_docs = ()
+    body = None
+    body_consumed = False
+    body_streamed = False
+    connection_header_sent = False
+    chunked = False
+    
+    def handle_one_request(self):
+        """Serve the next request on a kept-alive connection, unless draining."""
+        # Nothing of the previous request may leak into this one, even if it fails to parse
+        self.trace = None
+        self.body = None
+        self.body_consumed = False
+        self.body_streamed = False
+        if not self.connection_waiting(True):
+            self.close_connection = True
+            return
+        super().handle_one_request()
+    
+    def parse_request(self):
+        self.connection_waiting(False)
+        return super().parse_request()
+    
+    def connection_waiting(self, waiting):
+        connection_waiting = getattr(self.server, 'connection_waiting', None)
+        return connection_waiting is None or connection_waiting(self.connection, waiting)
+    
+    def log_error(self, format, *args):
+        # An idle keep-alive connection timing out is routine
+        if not format.startswith("Request timed out"):
+            super().log_error(format, *args)
+    
+    @contextmanager
+    def traced(self, path):
+        """Open a RequestTrace for this request and record it when done."""
+        route = path if path in TRACED_ROUTES else 'other'
+        request_id = self.headers.get('X-Request-ID')
+        self.trace = RequestTrace(route, self.command, trace_id=request_id,
+                                  log=config.TRACE_LOG or request_id is not None)
+        # The whole request works against one knowledge snapshot
+        self.snapshot = KNOWLEDGE.acquire()
+        self.reset_turn()
+        try:
+            yield self.trace
+        finally:
+            self.snapshot.release()
+            self.trace.finish(self.status_code)
+    
+    def reset_turn(self):
+        """Clear the state one chat turn accumulates."""
+        self.answered_by = None
+        self.session = None
+        self.ollama_context = None
+        self.ollama_host = None
+        self.prompt_docs = ()
+    
+    def send_response(self, code, message=None):
+        """Send the status line, remembering the code and echoing the trace ID."""
+        self.status_code = code
+        self.connection_header_sent = False
+        super().send_response(code, message)
+        if self.trace is not None:
+            self.send_header('X-Request-ID', self.trace.trace_id)
+        if getattr(self.server, 'draining', False) or self.body_unread():
+            self.send_header('Connection', 'close')
+    
+    def send_header(self, keyword, value):
+        # send_error adds its own Connection: close after send_response may have sent one
+        if keyword.lower() == 'connection':
+            if self.connection_header_sent:
+                return
+            self.connection_header_sent = True
+        super().send_header(keyword, value)
+    
+    def body_unread(self):
+        # Left on the connection, it would be parsed as the next request
+        headers = getattr(self, 'headers', None)
+        # A body read while the response streams is checked once the response ends
+        if headers is None or self.body_consumed or self.body_streamed:
+            return False
+        return self.body_chunked() or headers.get('Content-Length', '0') != '0'
+    
+    def body_chunked(self):
+        return 'chunked' in self.headers.get('Transfer-Encoding', '').lower()
+    
     def do_OPTIONS(self):
         """Handle CORS preflight requests."""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+        with self.traced(urlparse(self.path).path):
+            self.send_response(200)
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+            self.send_header('Access-Control-Allow-Headers', 'Content-Type, X-Request-ID')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
     
     def do_GET(self):
         """Handle GET requests."""
         parsed_path = urlparse(self.path)
         
-        if parsed_path.path == '/health':
-            self.handle_health()
-        elif parsed_path.path == '/api/knowledge':
-            self.handle_knowledge()
-        else:
-            self.handle_home()
+        with self.traced(parsed_path.path):
+            if parsed_path.path == '/health':
+                self.handle_health()
+            elif parsed_path.path == '/api/knowledge':
+                self.handle_knowledge()
+            elif parsed_path.path == '/metrics':
+                self.handle_metrics()
+            else:
+                self.handle_home()
     
     def do_POST(self):
         """Handle POST requests."""
         parsed_path = urlparse(self.path)
         
-        if parsed_path.path == '/api/chat':
-            self.handle_chat()
-        elif parsed_path.path == '/api/newsletters':
-            self.handle_newsletters()
+        with self.traced(parsed_path.path):
+            if parsed_path.path == '/api/chat':
+                self.run_slow(self.handle_chat)
+            elif parsed_path.path == '/api/chat/batch':
+                # Fans its LLM work out to the worker pool itself
+                self.handle_chat_batch(parse_qs(parsed_path.query))
+            elif parsed_path.path == '/api/newsletters':
+                self.handle_newsletters()
+            elif parsed_path.path == '/admin/reload':
+                self.handle_admin_reload()
+            else:
+                self.send_error(404, "Not Found")
+    
+    def run_slow(self, handler):
+        """Run an LLM-bound handler on the server's bounded worker pool."""
+        run_in_worker = getattr(self.server, 'run_in_worker', None)
+        if run_in_worker is None:
+            handler()
         else:
-            self.send_error(404, "Not Found")
+            run_in_worker(handler)
     
     def handle_health(self):
         """Health check endpoint."""
-        response = {
-            "status": "healthy",
-            "ai_backend": "Ollama Llama 3.1",
-            "cost": "$0 (completely free)",
-            "timestamp": "2025-09-17T18:57:00Z"
+        status = {
+            "answer_cache": ANSWER_CACHE.stats(),
+            "sessions": SESSIONS.stats(),
+            "generations": FLIGHTS.stats(),
+            "knowledge_version": self.snapshot.version,
+            "retrieval": self.snapshot.retriever.stats(),
+            "ollama": get_client().stats()
         }
         
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(response).encode())
+        self.send_json(200, dict(HEALTH_METADATA, **status))
     
     def handle_knowledge(self):
         """Return available knowledge base."""
-        knowledge = {
-            "total_documents": len(KNOWLEDGE_BASE),
-            "categories": list(set(doc["category"] for doc in KNOWLEDGE_BASE.values())),
-            "sources": list(set(doc["source"] for doc in KNOWLEDGE_BASE.values()))
-        }
+        snapshot = self.snapshot
+        self.send_prepared(RESPONSES.get('knowledge', snapshot.version,
+                                         lambda: json.dumps(snapshot.describe())))
+    
+    def handle_metrics(self):
+        """Prometheus metrics in text exposition format."""
+        body = REGISTRY.render().encode()
         
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(knowledge).encode())
+        self.send_body(200, body, 'text/plain; version=0.0.4; charset=utf-8')
     
     def handle_home(self):
         """Serve simple API documentation."""
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Qbit RAG Backend API</title>
-        </head>
-        <body>
-            <h1>Qbit RAG Backend API</h1>
-            
-            <h2>Available Endpoints:</h2>
-            
-            <p><strong>GET</strong> /health - Health check and system status</p>
-            <p><strong>POST</strong> /api/chat - Chat with AI assistant</p>
-            <p><strong>GET</strong> /api/knowledge - Get knowledge base information</p>
-            <p><strong>POST</strong> /api/newsletters - Generate AI-powered newsletters</p>
-            
-        </body>
-        </html>
-        """
-        
-        self.send_response(200)
-        self.send_header('Content-Type', 'text/html')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(html.encode())
+        self.send_prepared(RESPONSES.get('home', None, lambda: HOME_PAGE, 'text/html'))
     
     def handle_chat(self):
         """Handle chat requests with Ollama AI."""
         try:
             # Read request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            with self.trace.stage("parse"):
+                request_data = json.loads(self.read_body().decode('utf-8'))
             
             user_message = request_data.get('message', '')
             
+            # Follow-ups send back the conversation_id of the first reply
+            self.session = SESSIONS.begin(conversation_id_from(request_data), get_client().model)
+            self.trace.annotate(session="resumed" if self.session.has_history else "new")
+            
             # Search for relevant documents
-            relevant_docs = self.search_documents(user_message)
+            with self.trace.stage("retrieval"):
+                relevant_docs = self.search_documents(user_message)
+            
+            # Factual questions answered verbatim by one sentence skip the LLM
+            with self.trace.stage("extractive"):
+                extract = self.extract_answer(user_message, relevant_docs)
+            if extract is not None:
+                relevant_docs = [doc for doc in relevant_docs if doc['id'] == extract['doc_id']]
+            
+            # Streaming clients get tokens as Ollama produces them
+            stream_format = self.requested_stream_format(request_data)
+            if stream_format:
+                self.stream_chat(user_message, relevant_docs, stream_format, extract)
+                return
             
             # Generate AI response using Ollama
-            ai_response = self.generate_ollama_response(user_message, relevant_docs)
+            if extract is not None:
+                self.answered_by = "extractive"
+                ai_response = extract['answer']
+            else:
+                ai_response = self.generate_ollama_response(user_message, relevant_docs)
+            self.record_answer()
+            self.remember_turn(user_message, ai_response)
             
             # Prepare response
             response = {
                 "response": ai_response,
                 "sources": [doc['source'] for doc in relevant_docs],
-                "conversation_id": str(uuid.uuid4()),
-                "ai_model": "Llama 3.1 8B (Ollama)"
+                "conversation_id": self.session.conversation_id,
+                "ai_model": config.OLLAMA_MODEL_LABEL,
+                "answered_by": self.answered_by
             }
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            with self.trace.stage("serialize"):
+                self.send_json(200, response)
             
         except Exception as e:
             print(f"Error in chat handler: {e}")
             error_response = {
                 "response": "I'm sorry, I encountered an error processing your request. Please try again.",
                 "sources": [],
-                "conversation_id": str(uuid.uuid4()),
+                "conversation_id": self.session.conversation_id if self.session else str(uuid.uuid4()),
                 "error": str(e)
             }
             
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(error_response).encode())
+            self.send_json(500, error_response)
+    
+    def requested_stream_format(self, request_data):
+        """Return 'sse', 'ndjson' or None depending on what the client asked for."""
+        accept = self.headers.get('Accept', '')
+        if 'text/event-stream' in accept:
+            return 'sse'
+        if 'application/x-ndjson' in accept:
+            return 'ndjson'
+        if request_data.get('stream'):
+            return 'ndjson' if request_data.get('stream_format') == 'ndjson' else 'sse'
+        return None
+    
+    def stream_chat(self, user_message, relevant_docs, stream_format, extract=None):
+        """Relay Ollama's incremental output to the client as SSE or NDJSON.
+        
+        Sources and the conversation id go out first so the app can render them
+        before the first token arrives; a final 'done' event carries the full
+        response text and which path answered. An extractive answer is sent
+        as a single token.
+        """
+        meta = {
+            "sources": [doc['source'] for doc in relevant_docs],
+            "conversation_id": self.session.conversation_id,
+            "ai_model": config.OLLAMA_MODEL_LABEL
+        }
+        
+        self.start_stream('text/event-stream' if stream_format == 'sse' else 'application/x-ndjson')
+        
+        def send_event(event, payload):
+            if stream_format == 'sse':
+                message = f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            else:
+                message = json.dumps(dict(payload, type=event)) + "\n"
+            self.write_stream(message.encode())
+        
+        if extract is not None:
+            tokens = self.stream_extractive_response(extract)
+        else:
+            tokens = self.stream_ollama_response(user_message, relevant_docs)
+        try:
+            send_event("meta", meta)
+            full_response = []
+            with self.trace.stage("generation"):
+                for token in tokens:
+                    full_response.append(token)
+                    send_event("token", {"token": token})
+            self.record_answer()
+            self.remember_turn(user_message, "".join(full_response))
+            send_event("done", {"response": "".join(full_response), "answered_by": self.answered_by})
+            self.end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            print("Client disconnected during streaming response")
+            self.close_connection = True
+        except Exception:
+            # Headers are out, so the error can't be reported; end the response
+            self.close_connection = True
+            raise
+        finally:
+            # Closes the upstream Ollama connection if the client went away
+            tokens.close()
+    
+    def handle_chat_batch(self, query):
+        """Answer a batch of messages, streaming one NDJSON line per message.
+        
+        Retrieval runs for each group of messages at once: the whole batch
+        for a JSON body, each received group of lines for an NDJSON upload.
+        Messages that need the LLM are generated on the worker pool,
+        BATCH_PARALLELISM at a time, and each line goes out as soon as it is
+        ready, so lines arrive out of order, tagged with the message's index.
+        A final 'done' line carries the counts.
+        """
+        try:
+            with self.trace.stage("parse"):
+                options = batch_options({key: values[-1] for key, values in query.items()})
+                if 'ndjson' in self.headers.get('Content-Type', ''):
+                    # Wait for the first message only; the rest is read as it is answered
+                    groups = iter_ndjson(self.iter_body(), config.BATCH_MAX_ITEMS)
+                    first = next(groups, None)
+                    if first is None:
+                        raise ValueError("Expected at least one message")
+                    groups = itertools.chain([first], groups)
+                    self.body_streamed = True
+                else:
+                    items, options = parse_batch(self.read_body(), options, config.BATCH_MAX_ITEMS)
+                    groups = iter([(items, [])])
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except TimeoutError:
+            self.send_json(408, {"error": "Timed out reading the request body"})
+            return
+        
+        mode = options['mode']
+        self.trace.annotate(batch_mode=mode)
+        started = time.perf_counter()
+        counts = {"count": 0, "generated": 0, "errors": 0}
+        
+        self.start_stream('application/x-ndjson')
+        
+        def send_line(payload):
+            self.write_stream((json.dumps(payload) + "\n").encode())
+        
+        def needs_llm():
+            """Answer what needs no LLM as each group arrives; yield the rest."""
+            while True:
+                try:
+                    group = next(groups, None)
+                except (ValueError, TimeoutError) as e:
+                    # The upload broke off, stalled or ran past BATCH_MAX_ITEMS; the 200 is already out
+                    counts["errors"] += 1
+                    error = "Timed out reading the request body" if isinstance(e, TimeoutError) else str(e)
+                    send_line({"type": "error", "error": error})
+                    self.close_connection = True
+                    return
+                if group is None:
+                    return
+                items, invalid = group
+                counts["count"] += len(items) + len(invalid)
+                counts["errors"] += len(invalid)
+                BATCH_ITEMS.inc(len(items), mode=mode)
+                for index, error in invalid:
+                    send_line({"type": "error", "index": index, "error": error})
+                
+                with self.trace.stage("retrieval"):
+                    results = self.snapshot.retriever.search_many([item.message for item in items], k=3)
+                
+                # Answers that don't need the LLM go out straight away
+                with self.trace.stage("extractive"):
+                    for item, docs in zip(items, results):
+                        if mode == 'retrieval':
+                            send_line(item.tag(retrieval_result(docs)))
+                            continue
+                        turn = self.batch_turn()
+                        extract = turn.extract_answer(item.message, docs, options.get('threshold'))
+                        if extract is not None or mode == 'extractive':
+                            send_line(item.tag(turn.extractive_result(extract, docs, record=mode == 'full')))
+                        else:
+                            counts["generated"] += 1
+                            yield item, turn, docs
+        
+        jobs = None
+        try:
+            # Also covers reading and answering the rest of a streamed upload
+            with self.trace.stage("generation"):
+                jobs = run_bounded(self.submit_to_worker,
+                                   lambda job: job[1].generated_result(job[0].message, job[2]),
+                                   needs_llm(), max(1, config.BATCH_PARALLELISM))
+                for (item, _, _), future in jobs:
+                    try:
+                        payload = future.result()
+                    except Exception as e:
+                        counts["errors"] += 1
+                        payload = {"type": "error", "error": str(e)}
+                    send_line(item.tag(payload))
+            
+            self.trace.annotate(batch_items=counts["count"])
+            send_line(dict(type="done", **counts,
+                           duration_ms=round((time.perf_counter() - started) * 1000, 3)))
+            self.end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            print("Client disconnected during batch response")
+            self.close_connection = True
+        except Exception:
+            # Headers are out, so the error can't be reported; end the response
+            self.close_connection = True
+            raise
+        finally:
+            # Messages not started yet are dropped if the client went away
+            if jobs is not None:
+                jobs.close()
+            self.body_streamed = False
+            if self.body_unread():
+                self.close_connection = True
+    
+    def batch_turn(self):
+        """A copy of this handler for one message of a batch, with its own
+        turn state and stage timings."""
+        turn = copy.copy(self)
+        turn.trace = StageTimer(self.trace.route)
+        turn.reset_turn()
+        return turn
+    
+    def extractive_result(self, extract, docs, record=True):
+        """Batch result line for an extractive answer, or for none."""
+        if extract is None:
+            return {"type": "result", "response": None, "sources": [doc['source'] for doc in docs],
+                    "answered_by": None, "confidence": None}
+        self.answered_by = "extractive"
+        if record:
+            self.record_answer()
+        return {
+            "type": "result",
+            "response": extract['answer'],
+            "sources": [doc['source'] for doc in docs if doc['id'] == extract['doc_id']],
+            "answered_by": self.answered_by,
+            "confidence": extract['confidence']
+        }
+    
+    def generated_result(self, message, docs):
+        """Batch result line for a message answered by the LLM (runs on a worker)."""
+        response = self.generate_ollama_response(message, docs)
+        self.record_answer()
+        return {
+            "type": "result",
+            "response": response,
+            "sources": [doc['source'] for doc in docs],
+            "answered_by": self.answered_by
+        }
+    
+    def submit_to_worker(self, func, *args):
+        """Queue func on the server's worker pool, or run it right away without one."""
+        submit = getattr(self.server, 'submit_to_worker', None)
+        if submit is not None:
+            return submit(func, *args)
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    def start_stream(self, content_type):
+        """Send the headers of a 200 response whose length isn't known up front.
+        
+        HTTP/1.1 clients get it chunked, so the connection stays reusable;
+        HTTP/1.0 clients read until the connection closes.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.chunked = self.request_version != 'HTTP/1.0'
+        if self.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+        self.end_headers()
+    
+    def write_stream(self, data):
+        """Send part of a streamed body right away."""
+        if self.chunked:
+            data = b"%x\r\n%s\r\n" % (len(data), data)
+        self.wfile.write(data)
+        self.wfile.flush()
+    
+    def end_stream(self):
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
     
     def handle_newsletters(self):
-        """Generate AI-powered newsletters."""
+        """Serve AI-powered newsletters."""
         try:
             # Read request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
+            request_data = json.loads(self.read_body().decode('utf-8'))
             
-            count = request_data.get('count', 2)  # Default to 2 newsletters
+            count = int(request_data.get('count', 2))  # Default to 2 newsletters
+            # The scheduler only generates batch_size entries; both paths serve 0..batch_size
+            count = min(max(count, 0), NEWSLETTER_SCHEDULER.batch_size)
             
-            # Generate newsletters using Ollama
-            newsletters = self.generate_newsletters(count)
-            
-            response = {
-                "newsletters": newsletters,
-                "generated_at": "2025-09-17T18:57:00Z",
-                "ai_model": "Llama 3.1 8B (Ollama)"
-            }
+            # Serve the latest batch precomputed by the background scheduler
+            batch = NEWSLETTER_SCHEDULER.latest()
+            if batch is not None:
+                newsletters, generated_at = batch
+                response = {
+                    "newsletters": newsletters[:count],
+                    "generated_at": generated_at,
+                    "ai_model": config.OLLAMA_MODEL_LABEL
+                }
+            else:
+                # First batch is still being generated
+                response = {
+                    "newsletters": [create_fallback_newsletter(topic["category"])
+                                    for topic in newsletter_topics(count)],
+                    "generated_at": utc_timestamp(),
+                    "error": "Newsletters are still being generated, using fallback content"
+                }
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(response).encode())
+            self.send_json(200, response)
             
         except Exception as e:
             print(f"Error in newsletter handler: {e}")
@@ -225,251 +709,292 @@ class OllamaRAGHandler(BaseHTTPRequestHandler):
             
             error_response = {
                 "newsletters": fallback_newsletters,
-                "generated_at": "2025-09-17T18:57:00Z",
+                "generated_at": utc_timestamp(),
                 "error": "AI generation failed, using fallback content"
             }
             
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(error_response).encode())
-    
-    def generate_newsletters(self, count=2):
-        """Generate newsletters using Ollama - Always AI/Software + Electronics/DFT."""
-        # Always generate these two specific types
-        topics = [
-            {
-                "topic": "Latest AI and Software Engineering trends and breakthroughs",
-                "category": "AI & Software Engineering"
-            },
-            {
-                "topic": "Electronics hardware development and Design for Testability (DFT) methodologies",
-                "category": "Electronics & DFT"
-            }
-        ]
-        
-        newsletters = []
-        
-        for topic_data in topics:
-            topic = topic_data["topic"]
-            category = topic_data["category"]
-            
-            # Create prompt for newsletter generation
-            prompt = f"""Create a newsletter entry about: {topic}
-
-STRICT FORMAT - respond with EXACTLY this format:
-Title: [write your engaging title here - max 8 words]
-Description: [write your description here - max 120 characters]
-
-Requirements:
-- Make title engaging and specific to recent trends
-- Keep description under 120 characters
-- Focus on practical applications and latest developments
-
-Topic: {topic}"""
-
-            try:
-                # Call Ollama API
-                ollama_response = requests.post(
-                    "http://localhost:11434/api/generate",
-                    json={
-                        "model": "llama3.1:8b",
-                        "prompt": prompt,
-                        "stream": False
-                    },
-                    timeout=15
-                )
-                
-                if ollama_response.status_code == 200:
-                    result = ollama_response.json()
-                    ai_content = result.get('response', '')
-                    print(f"🤖 AI Response for {category}: {ai_content}")
-                    
-                    # Parse AI response
-                    newsletter = self.parse_newsletter_response(ai_content, category)
-                    print(f"📝 Parsed Newsletter: {newsletter}")
-                    newsletters.append(newsletter)
-                else:
-                    print(f"❌ Ollama API error: {ollama_response.status_code}")
-                    # Fallback if Ollama fails
-                    newsletters.append(self.create_fallback_newsletter(category))
-                    
-            except Exception as e:
-                print(f"Error generating newsletter: {e}")
-                newsletters.append(self.create_fallback_newsletter(category))
-        
-        return newsletters
+            self.send_json(200, error_response)
     
-    def parse_newsletter_response(self, ai_content, category):
-        """Parse AI response into newsletter format."""
-        lines = ai_content.strip().split('\n')
+    def handle_admin_reload(self):
+        """Apply knowledge base changes without a restart.
         
-        title = "Tech Update"
-        description = "Latest technology updates."
+        Requires 'Authorization: Bearer <QBIT_ADMIN_TOKEN>'. An empty body
+        re-reads the configured source; {"upsert": {doc_id: doc}, "delete":
+        [doc_id]} changes individual documents and {"documents": {...}}
+        replaces the whole knowledge base.
+        """
+        if not config.ADMIN_TOKEN:
+            self.send_error(404, "Not Found")
+            return
+        
+        authorization = self.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {config.ADMIN_TOKEN}".encode()):
+            self.send_json(401, {"error": "Unauthorized"})
+            return
         
-        for line in lines:
-            line = line.strip()
-            # Handle various title formats
-            if any(prefix in line.lower() for prefix in ['title:', '**title:**', 'title']):
-                # Extract title - remove markdown, quotes, and prefixes
-                title_text = line
-                title_text = title_text.replace('**Title:**', '').replace('Title:', '')
-                title_text = title_text.replace('**title:**', '').replace('title:', '')
-                title_text = title_text.replace('"', '').replace("'", '').strip()
-                if title_text and len(title_text) > 3:  # Valid title
-                    title = title_text
+        try:
+            request_data = json.loads(self.read_body() or b'{}')
+            if not isinstance(request_data, dict):
+                raise ReloadError("Request body must be a JSON object")
             
-            # Handle various description formats  
-            elif any(prefix in line.lower() for prefix in ['description:', '**description:**', 'description']):
-                # Extract description - remove markdown, quotes, and prefixes
-                desc_text = line
-                desc_text = desc_text.replace('**Description:**', '').replace('Description:', '')
-                desc_text = desc_text.replace('**description:**', '').replace('description:', '')
-                desc_text = desc_text.replace('"', '').replace("'", '').strip()
-                if desc_text and len(desc_text) > 10:  # Valid description
-                    description = desc_text
+            if 'documents' in request_data:
+                result = KNOWLEDGE.replace(request_data['documents'])
+            elif 'upsert' in request_data or 'delete' in request_data:
+                result = KNOWLEDGE.apply(request_data.get('upsert'), request_data.get('delete', []))
+            else:
+                result = KNOWLEDGE.reload()
+        except (ReloadError, ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
         
-        # Fallback: if we didn't find proper title/description, try to extract from content
-        if title == "Tech Update" or description == "Latest technology updates.":
-            content = ai_content.lower()
-            if 'ai' in content or 'software' in content:
-                title = "AI & Software Engineering News"
-                description = "Latest AI and software development innovations and trends."
-            elif 'electronics' in content or 'dft' in content or 'hardware' in content:
-                title = "Electronics & DFT Updates"
-                description = "Hardware design and Design for Testability advancements."
+        print(f"🔄 Knowledge base now at version {KNOWLEDGE.snapshot.version}: {result}")
+        self.send_json(200, result)
+    
+    def read_body(self):
+        """Read the request body (once), so the connection can carry the next request."""
+        if self.body is None:
+            self.body = b"".join(self.iter_body())
+        return self.body
+    
+    def iter_body(self, size=65536):
+        """Yield the request body as it arrives, decoding chunked transfer
+        encoding; raises ValueError on malformed chunk framing."""
+        if self.body_chunked():
+            while True:
+                line = self.rfile.readline(MAX_CHUNK_LINE + 1)
+                if len(line) > MAX_CHUNK_LINE or not line.endswith(b"\n"):
+                    raise ValueError("Malformed chunked request body")
+                chunk_size = int(line.split(b";", 1)[0].strip(), 16)
+                if chunk_size == 0:
+                    break
+                data = self.rfile.read(chunk_size)
+                if len(data) < chunk_size or self.rfile.readline(MAX_CHUNK_LINE + 1).strip():
+                    raise ValueError("Malformed chunked request body")
+                yield data
+            # Trailer fields, up to the blank line ending the body
+            while True:
+                line = self.rfile.readline(MAX_CHUNK_LINE + 1)
+                if not line.strip():
+                    break
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                data = self.rfile.read(min(size, remaining))
+                if not data:
+                    raise ValueError("Request body ended early")
+                remaining -= len(data)
+                yield data
+        self.body_consumed = True
+    
+    def send_json(self, status, payload):
+        """Send a JSON response with CORS headers."""
+        self.send_body(status, json.dumps(payload).encode(), 'application/json')
+    
+    def send_body(self, status, body, content_type):
+        """Send a complete body with its Content-Length, gzipped when it is
+        large enough and the client accepts it."""
+        compressible = len(body) >= config.GZIP_MIN_BYTES
+        encoding = None
+        if compressible and accepts_gzip(self.headers.get('Accept-Encoding')):
+            body = compress(body)
+            encoding = 'gzip'
         
-        return {
-            "title": title,
-            "description": description,
-            "category": category
-        }
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if compressible:
+            self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
     
-    def create_fallback_newsletter(self, category):
-        """Create fallback newsletter if AI fails."""
-        fallback_map = {
-            "AI & Software Engineering": {
-                "title": "AI & Software Engineering Update",
-                "description": "Latest developments in AI and modern software practices.",
-                "category": "AI & Software Engineering"
-            },
-            "Electronics & DFT": {
-                "title": "Electronics & DFT Innovations",
-                "description": "Hardware design trends and Design for Testability advances.",
-                "category": "Electronics & DFT"
-            }
-        }
+    def send_prepared(self, prepared):
+        """Send a PreparedResponse, or 304 Not Modified when the client's
+        If-None-Match already names it."""
+        body, etag, encoding = prepared.representation(self.headers.get('Accept-Encoding'))
+        not_modified = etag_matches(self.headers.get('If-None-Match'), prepared.etag)
         
-        return fallback_map.get(category, {
-            "title": "Technology Update",
-            "description": "Latest technology trends and innovations.",
-            "category": "Technology"
-        })
-
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        if prepared.gzipped is not None:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if not_modified:
+            self.end_headers()
+            return
+        self.send_header('Content-Type', prepared.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+    
     def search_documents(self, query):
-        """Smart keyword-based document search."""
-        query_lower = query.lower()
-        results = []
-        
-        # Enhanced keyword mapping
-        keyword_mapping = {
-            "work from home": ["remote", "home office", "wfh"],
-            "remote work": ["remote", "home office", "wfh"],
-            "wfh": ["remote", "home office"],
-            "leave": ["annual", "vacation", "pto", "time off"],
-            "vacation": ["leave", "annual", "pto"],
-            "health": ["medical", "dental", "vision", "insurance"],
-            "insurance": ["health", "medical", "benefits"],
-            "it support": ["technical", "computer", "password"],
-            "performance": ["review", "evaluation", "rating"],
-            "salary": ["compensation", "pay", "bonus"],
-            "compensation": ["salary", "pay", "bonus", "benefits"],
-            "ticket": ["tickets", "active", "it ticket", "support ticket", "issue"],
-            "tickets": ["ticket", "active", "it ticket", "support ticket", "issues"],
-            "my tickets": ["active tickets", "open tickets", "pending tickets"]
-        }
+        """Search the knowledge base with the configured retrieval mode."""
+        snapshot = self.snapshot or KNOWLEDGE.snapshot
+        return snapshot.retriever.search(query, k=3)  # Return top 3 results
+    
+    def extract_answer(self, query, docs, threshold=None):
+        """Return a confident extractive answer from the retrieved documents, or None."""
+        threshold = config.EXTRACTIVE_THRESHOLD if threshold is None else threshold
+        if threshold > 1:
+            return None
+        snapshot = self.snapshot or KNOWLEDGE.snapshot
+        extract = extract_answer(query, docs, snapshot.index, threshold)
+        if extract is not None:
+            self.trace.annotate(extractive_confidence=extract['confidence'])
+        return extract
+    
+    def record_answer(self):
+        """Count which path produced the answer and note it in the trace."""
+        CHAT_ANSWERS.inc(path=self.answered_by)
+        self.trace.annotate(answered_by=self.answered_by)
+    
+    def remember_turn(self, question, answer):
+        """Add the finished turn to the conversation's session."""
+        SESSIONS.record(self.session.conversation_id, question, answer,
+                        base_generation=self.session.generation, context=self.ollama_context,
+                        model=get_client().model, docs=self.prompt_docs, host=self.ollama_host)
+    
+    def prepare_prompt(self, query, docs):
+        """Return the prompt and extra /api/generate fields for this turn.
         
-        # Expand query with synonyms
-        expanded_terms = query_lower.split()
-        for term in query_lower.split():
-            for key, synonyms in keyword_mapping.items():
-                if term in key or key in query_lower:
-                    expanded_terms.extend(synonyms)
+        Follow-ups in a conversation with Ollama context tokens send only the
+        new question, unseen documents and turns the tokens don't hold yet.
+        """
+        session = self.session
+        if session is not None and session.context is not None:
+            new_docs = [doc for doc in docs if doc['id'] not in session.context_docs]
+            prompt = build_followup_prompt(query, new_docs, config.PROMPT_DOCUMENT_TOKENS, session.turns)
+            extra = {"context": session.context, "affinity": session.host}
+            self.trace.annotate(context_tokens=len(session.context))
+        else:
+            prompt = build_chat_prompt(query, docs, config.PROMPT_DOCUMENT_TOKENS,
+                                       session.turns if session is not None else ())
+            extra = {}
         
-        for doc_id, doc in KNOWLEDGE_BASE.items():
-            content_lower = doc['content'].lower()
-            category_lower = doc['category'].lower()
-            
-            # Check for matches in content, category, or expanded terms
-            score = 0
-            for term in expanded_terms:
-                if term in content_lower:
-                    score += 2
-                if term in category_lower:
-                    score += 3
-                if term in doc_id:
-                    score += 1
-            
-            if score > 0:
-                results.append({
-                    "id": doc_id,
-                    "content": doc['content'],
-                    "source": doc['source'],
-                    "category": doc['category'],
-                    "score": score
-                })
+        self.prompt_docs = prompt.docs
+        PROMPT_TOKENS.observe(prompt.tokens)
+        self.trace.annotate(prompt_tokens_estimate=prompt.tokens, prompt_docs=len(prompt.docs),
+                            prompt_docs_trimmed=prompt.trimmed, prompt_docs_dropped=prompt.dropped)
+        return prompt.text, extra
+    
+    def cache_key(self, query, docs):
+        """Answer cache key, or None for follow-ups whose answer depends on the conversation."""
+        if self.session is not None and self.session.has_history:
+            return None
+        return ANSWER_CACHE.make_key(query, docs)
+    
+    def start_generation(self, query, docs, cache_key):
+        """Start the Ollama generation for this prompt, or join an identical one
+        already running; returns (chunk iterator, whether this request leads)."""
+        with self.trace.stage("prompt"):
+            prompt, extra = self.prepare_prompt(query, docs)
         
-        # Sort by relevance score
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:3]  # Return top 3 results
+        key = cache_key if config.LLM_COALESCE else None
+        flight, leader = FLIGHTS.join(key, lambda: get_client().generate_stream(
+            prompt, timeout=config.OLLAMA_CHAT_TIMEOUT, **extra))
+        if not leader:
+            self.trace.annotate(coalesced=True)
+        return flight.follow(), leader
     
     def generate_ollama_response(self, query, docs):
         """Generate response using Ollama Llama 3.1."""
+        cache_key = self.cache_key(query, docs)
+        cached = ANSWER_CACHE.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            self.trace.annotate(answer_cache="hit")
+            self.answered_by = "cache"
+            return cached
+        
+        self.answered_by = "fallback"
         try:
-            # Prepare context from relevant documents
-            context = ""
-            if docs:
-                context = "\n\nRelevant company information:\n"
-                for doc in docs:
-                    context += f"- {doc['content']}\n"
-            
-            # Create prompt for Llama 3.1
-            prompt = f"""You are a helpful AI assistant for Qbit company employees. Answer questions concisely and directly.
-
-            User Question: {query}
-            {context}
-
-            Instructions:
-            - Give direct, specific answers
-            - Keep responses under 2-3 sentences when possible
-            - Lead with the key information (numbers, dates, etc.)
-            - Be friendly but brief
-
-            Response:"""
+            chunks, leader = self.start_generation(query, docs, cache_key)
             
             # Call Ollama API
-            ollama_response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={
-                    "model": "llama3.1:8b",
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=30
-            )
-            
-            if ollama_response.status_code == 200:
-                result = ollama_response.json()
-                return result.get('response', 'I apologize, but I received an empty response from the AI model.')
-            else:
-                print(f"Ollama API error: {ollama_response.status_code}")
-                return self.fallback_response(query, docs)
+            produced = []
+            final = {}
+            with self.trace.stage("generation"):
+                for chunk in chunks:
+                    if chunk.get('response'):
+                        produced.append(chunk['response'])
+                    if chunk.get('done'):
+                        final = chunk
+            self.trace.annotate(prompt_tokens=final.get('prompt_eval_count'),
+                                completion_tokens=final.get('eval_count'))
+            response = "".join(produced)
+            if not response:
+                return 'I apologize, but I received an empty response from the AI model.'
+            self.answered_by = "llm"
+            self.ollama_context = final.get('context')
+            self.ollama_host = final.get('host')
+            if cache_key is not None and leader:
+                ANSWER_CACHE.put(cache_key, response)
+            return response
                 
+        except Unavailable as e:
+            print(f"⚡ {e}, answering with fallback")
+            return self.fallback_response(query, docs)
+        except OllamaError as e:
+            print(e)
+            return self.fallback_response(query, docs)
         except Exception as e:
             print(f"Error calling Ollama: {e}")
             return self.fallback_response(query, docs)
     
+    def stream_ollama_response(self, query, docs):
+        """Yield response text chunks from Ollama as they are generated."""
+        cache_key = self.cache_key(query, docs)
+        cached = ANSWER_CACHE.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            self.trace.annotate(answer_cache="hit")
+            self.answered_by = "cache"
+            yield cached
+            return
+        
+        self.answered_by = "fallback"
+        produced = []
+        chunks = None
+        try:
+            chunks, leader = self.start_generation(query, docs, cache_key)
+            
+            for chunk in chunks:
+                if chunk.get('response'):
+                    self.answered_by = "llm"
+                    produced.append(chunk['response'])
+                    yield chunk['response']
+                if chunk.get('done'):
+                    self.trace.annotate(prompt_tokens=chunk.get('prompt_eval_count'),
+                                        completion_tokens=chunk.get('eval_count'))
+                    if produced:
+                        self.ollama_context = chunk.get('context')
+                        self.ollama_host = chunk.get('host')
+                        if cache_key is not None and leader:
+                            ANSWER_CACHE.put(cache_key, "".join(produced))
+                    
+        except Unavailable as e:
+            print(f"⚡ {e}, answering with fallback")
+            yield self.fallback_response(query, docs)
+        except OllamaError as e:
+            print(e)
+            yield self.fallback_response(query, docs)
+        except Exception as e:
+            print(f"Error streaming from Ollama: {e}")
+            if not produced:
+                yield self.fallback_response(query, docs)
+        finally:
+            # Stops listening, so a generation nobody follows any more is abandoned
+            if chunks is not None:
+                chunks.close()
+    
+    def stream_extractive_response(self, extract):
+        """Yield an extractive answer as a single chunk."""
+        self.answered_by = "extractive"
+        yield extract['answer']
+    
     def fallback_response(self, query, docs):
         """Fallback response if Ollama fails."""
         if docs:
@@ -477,14 +1002,44 @@ Topic: {topic}"""
         else:
             return "I'm here to help with questions about company policies, benefits, leave, IT support, performance reviews, and compensation. What would you like to know?"
 
-def start_server(port=8080):
+def retrieval_result(docs):
+    """Batch result line for a retrieval-only run."""
+    return {
+        "type": "result",
+        "sources": [doc['source'] for doc in docs],
+        "documents": [{"id": doc['id'], "source": doc['source'], "category": doc['category'],
+                       "score": doc['score']} for doc in docs]
+    }
+
+def start_server(port=None, workers=None):
     """Start the HTTP server."""
-    server_address = ('', port)
-    httpd = HTTPServer(server_address, OllamaRAGHandler)
+    port = config.PORT if port is None else port
+    workers = config.WORKERS if workers is None else workers
+    server_address = (config.HOST, port)
+    httpd = QbitHTTPServer(server_address, OllamaRAGHandler,
+                           workers=workers, max_connections=config.MAX_CONNECTIONS,
+                           backlog=config.LISTEN_BACKLOG)
+    
+    def request_shutdown(signum, frame):
+        # shutdown() blocks until serve_forever returns, so it can't run on this thread
+        threading.Thread(target=httpd.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, request_shutdown)
+    
+    get_client().start()
+    NEWSLETTER_SCHEDULER.start()
+    KNOWLEDGE.start()
     
     print(f"🚀 Starting Qbit RAG Backend (Ollama Powered) on port {port}")
-    print(f"🧠 AI Model: Llama 3.1 8B")
+    print(f"🧠 AI Model: {config.OLLAMA_MODEL} at {', '.join(e.host for e in get_client().endpoints)}")
     print(f"💰 Cost: $0 (Completely Free)")
+    knowledge = KNOWLEDGE.snapshot
+    print(f"📚 Knowledge: {knowledge.summary['total_documents']} documents"
+          + (f" ({knowledge.summary['total_chunks']} chunks)" if knowledge.store else "")
+          + f" from {config.DOC_STORE or config.KB_FILE or 'the built-in knowledge base'}")
+    print(f"🔍 Retrieval: {knowledge.retriever.mode}")
+    print(f"🧵 Workers: {workers} concurrent LLM requests")
+    print(f"📰 Newsletters: refreshed every {config.NEWSLETTER_REFRESH_INTERVAL / 3600:g}h in the background")
     print(f"🌐 Open: http://localhost:{port}")
     print(f"📚 API Docs: http://localhost:{port}")
     print(f"🔧 Test: curl -X POST http://localhost:{port}/api/chat -H 'Content-Type: application/json' -d '{{\"message\": \"Do I have any active tickets?\"}}'")        
@@ -492,8 +1047,17 @@ def start_server(port=8080):
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
-        print("\n🛑 Server stopped")
-        httpd.server_close()
+        pass
+    
+    NEWSLETTER_SCHEDULER.stop()
+    print(f"\n⏳ Draining {httpd.in_flight} in-flight request(s)...")
+    still_open = httpd.drain(config.DRAIN_TIMEOUT)
+    if still_open:
+        print(f"⚠️ Drain timed out with {still_open} request(s) still open")
+    httpd.server_close()
+    KNOWLEDGE.stop()
+    get_client().close()
+    print("🛑 Server stopped")
 
 if __name__ == "__main__":
     start_server()
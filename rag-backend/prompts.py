@@ -0,0 +1,180 @@
+"""
+Qbit RAG Backend - Prompt Assembly
+Token-budgeted chat prompts with a constant, cache-friendly prefix.
+
+Every chat prompt starts with the same system instructions, so Ollama can
+reuse the prefill of that prefix from one request to the next; everything
+that varies (documents, history, the question) comes after it. Retrieved
+documents are packed in relevance order into a token budget. A document
+repeating text that is already packed (overlapping chunks of one source) is
+trimmed to what is new or dropped. A document too long for the space left
+keeps the sentences that share the most words with the question.
+
+Token counts are estimated at about four characters per token, close enough
+for Llama's tokenizer on English text to size a budget; Ollama's own
+prompt_eval_count is still what the metrics report as prefilled.
+"""
+
+from extractive import split_sentences
+from retrieval import tokenize
+
+SYSTEM_PREFIX = """You are a helpful AI assistant for Qbit company employees. Answer questions concisely and directly.
+
+Instructions:
+- Give direct, specific answers
+- Keep responses under 2-3 sentences when possible
+- Lead with the key information (numbers, dates, etc.)
+- Be friendly but brief
+"""
+
+# Word n-gram size used to spot text repeated between chunks
+SHINGLE_SIZE = 8
+
+# Documents at least this much covered by already packed text are dropped
+DUPLICATE_COVERAGE = 0.8
+
+# Don't start another document with less budget than this left
+MIN_DOCUMENT_TOKENS = 24
+
+
+def estimate_tokens(text):
+    """Approximate Llama token count of a string."""
+    return (len(text) + 3) // 4
+
+
+class Prompt:
+    """An assembled prompt and what went into it."""
+
+    def __init__(self, text, docs, document_tokens, trimmed=0, dropped=0):
+        self.text = text
+        self.docs = docs  # Documents that made it into the prompt
+        self.document_tokens = document_tokens
+        self.trimmed = trimmed  # Documents shortened to fit or to remove repeated text
+        self.dropped = dropped  # Documents left out as duplicates or for lack of budget
+
+    @property
+    def tokens(self):
+        return estimate_tokens(self.text)
+
+
+def _shingles(words):
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def remove_repeats(text, seen):
+    """Strip the leading and trailing runs of text already covered by the
+    seen shingles; returns None when the text is essentially a duplicate."""
+    words = text.split()
+    lowered = [word.lower() for word in words]
+    if len(words) < SHINGLE_SIZE:
+        return text
+
+    covered = [False] * len(words)
+    for i in range(len(words) - SHINGLE_SIZE + 1):
+        if tuple(lowered[i:i + SHINGLE_SIZE]) in seen:
+            covered[i:i + SHINGLE_SIZE] = [True] * SHINGLE_SIZE
+    if sum(covered) >= DUPLICATE_COVERAGE * len(words):
+        return None
+
+    start, end = 0, len(words)
+    while start < end and covered[start]:
+        start += 1
+    while end > start and covered[end - 1]:
+        end -= 1
+    return text if (start, end) == (0, len(words)) else " ".join(words[start:end])
+
+
+def fit_to_budget(text, query_terms, budget):
+    """Shorten text to about budget tokens, keeping the sentences sharing the
+    most terms with the question in their original order."""
+    sentences = split_sentences(text)
+    ranked = sorted(range(len(sentences)),
+                    key=lambda i: (-len(query_terms & set(tokenize(sentences[i]))), i))
+    chosen = []
+    used = 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost <= budget:
+            chosen.append(i)
+            used += cost
+    if chosen:
+        return " ".join(sentences[i] for i in sorted(chosen))
+
+    # Not even one whole sentence fits: keep the start of the most relevant one
+    words = sentences[ranked[0]].split() if sentences else []
+    kept = []
+    for word in words:
+        if estimate_tokens(" ".join(kept + [word])) > budget:
+            break
+        kept.append(word)
+    return " ".join(kept) + " …" if kept else ""
+
+
+def pack_documents(query, docs, budget):
+    """Return [(doc, text)] for the documents that fit in budget tokens, in
+    relevance order, plus counts of trimmed and dropped documents."""
+    query_terms = set(tokenize(query))
+    seen = set()
+    packed = []
+    used = trimmed = dropped = 0
+
+    for doc in docs:
+        text = " ".join(doc['content'].split())
+        unique = remove_repeats(text, seen)
+        remaining = budget - used
+        if unique is None or remaining < MIN_DOCUMENT_TOKENS:
+            dropped += 1
+            continue
+        if estimate_tokens(unique) > remaining:
+            unique = fit_to_budget(unique, query_terms, remaining)
+            if not unique:
+                dropped += 1
+                continue
+        if unique != text:
+            trimmed += 1
+        seen |= _shingles([word.lower() for word in unique.split()])
+        packed.append((doc, unique))
+        used += estimate_tokens(unique)
+    return packed, used, trimmed, dropped
+
+
+def format_history(turns):
+    """Compact earlier turns as a prompt section."""
+    if not turns:
+        return ""
+    history = "Earlier in this conversation:\n"
+    for question, answer in turns:
+        history += f"Q: {question}\nA: {answer}\n"
+    return history + "\n"
+
+
+def build_chat_prompt(query, docs, budget, history=()):
+    """Build a chat prompt: constant instructions, packed documents, earlier
+    turns, then the question."""
+    packed, used, trimmed, dropped = pack_documents(query, docs, budget)
+    context = ""
+    if packed:
+        context = "Relevant company information:\n"
+        for _, text in packed:
+            context += f"- {text}\n"
+        context += "\n"
+
+    text = f"{SYSTEM_PREFIX}\n{context}{format_history(history)}User Question: {query}\n\nResponse:"
+    return Prompt(text, [doc for doc, _ in packed], used, trimmed, dropped)
+
+
+def build_followup_prompt(query, docs, budget, turns=()):
+    """Build the prompt for a follow-up that continues an Ollama context,
+    which already holds the instructions and earlier documents."""
+    packed, used, trimmed, dropped = pack_documents(query, docs, budget)
+    context = ""
+    if packed:
+        context = "More company information:\n"
+        for _, text in packed:
+            context += f"- {text}\n"
+        context += "\n"
+
+    text = (f"{format_history(turns)}{context}Follow-up question: {query}\n\n"
+            "Answer the follow-up using the conversation so far, with the same brief, direct style.\n\n"
+            "Response:")
+    return Prompt(text, [doc for doc, _ in packed], used, trimmed, dropped)
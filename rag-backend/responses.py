@@ -0,0 +1,95 @@
+"""
+Qbit RAG Backend - Responses
+Response bodies ready to send: compressed, tagged and cached.
+
+The handler speaks HTTP/1.1 with persistent connections, so every body is
+sent with an exact Content-Length. Bodies of GZIP_MIN_BYTES or more go out
+gzip-compressed to clients that accept it. Responses that only change with
+the knowledge base (/, /api/knowledge) are built once per knowledge version
+as a PreparedResponse holding the plain and compressed bytes and an ETag, so
+a repeat request costs a dictionary lookup, and a client revalidating with
+If-None-Match gets an empty 304.
+"""
+
+import gzip
+import hashlib
+import threading
+
+import config
+
+
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip."""
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            quality = params.strip().lower()
+            if not quality.startswith('q='):
+                return True
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def compress(body):
+    """gzip a body; mtime=0 keeps the output, and its ETag, stable."""
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header names this entity tag (any encoding)."""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag.strip('"')
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == opaque or candidate == f"{opaque}-gzip":
+            return True
+    return False
+
+
+class PreparedResponse:
+    """A response body with its gzip form and ETag computed up front."""
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        self.gzipped = compress(body) if len(body) >= config.GZIP_MIN_BYTES else None
+
+    def representation(self, accept_encoding):
+        """Return (body, ETag, Content-Encoding or None) for a client."""
+        if self.gzipped is not None and accepts_gzip(accept_encoding):
+            return self.gzipped, f'{self.etag[:-1]}-gzip"', 'gzip'
+        return self.body, self.etag, None
+
+
+class ResponseCache:
+    """Prepared responses, rebuilt when the version they depend on changes."""
+
+    def __init__(self):
+        self._responses = {}  # name -> (version, PreparedResponse)
+        self._lock = threading.Lock()
+
+    def get(self, name, version, build, content_type='application/json'):
+        """Return the PreparedResponse for name at version, building it with
+        build() (which returns str or bytes) if needed."""
+        entry = self._responses.get(name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        body = build()
+        prepared = PreparedResponse(body.encode() if isinstance(body, str) else body, content_type)
+        with self._lock:
+            self._responses[name] = (version, prepared)
+        return prepared
+
+    def clear(self):
+        with self._lock:
+            self._responses.clear()
@@ -0,0 +1,551 @@
+"""
+Qbit RAG Backend - Retrieval
+Inverted-index BM25 search over the knowledge base.
+
+The index is built once from a {doc_id: {content, source, category}} mapping
+and answers queries by walking only the postings of the query terms, so the
+cost of a search depends on how many documents share the query's words rather
+than on the size of the knowledge base. Queries reading many postings are
+scored with one vectorized NumPy accumulation instead of a Python loop; the
+results are the same.
+"""
+
+import heapq
+import math
+import re
+from array import array
+from operator import itemgetter
+
+import numpy as np
+
+# Enhanced keyword mapping - multi-word keys match as phrases, single words
+# (and the words of multi-word keys) expand to the listed synonyms
+KEYWORD_MAPPING = {
+    "work from home": ["remote", "home office", "wfh"],
+    "remote work": ["remote", "home office", "wfh"],
+    "wfh": ["remote", "home office"],
+    "leave": ["annual", "vacation", "pto", "time off"],
+    "vacation": ["leave", "annual", "pto"],
+    "health": ["medical", "dental", "vision", "insurance"],
+    "insurance": ["health", "medical", "benefits"],
+    "it support": ["technical", "computer", "password"],
+    "performance": ["review", "evaluation", "rating"],
+    "salary": ["compensation", "pay", "bonus"],
+    "compensation": ["salary", "pay", "bonus", "benefits"],
+    "ticket": ["tickets", "active", "it ticket", "support ticket", "issue"],
+    "tickets": ["ticket", "active", "it ticket", "support ticket", "issues"],
+    "my tickets": ["active tickets", "open tickets", "pending tickets"]
+}
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it's me my of on or
+our the their there this to was what when where which who why will with you your
+""".split())
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Weight of a synonym relative to a term the user actually typed
+SYNONYM_WEIGHT = 0.5
+
+# Extra weight for query terms that hit a document's category or id
+META_BOOST = 1.5
+
+# Postings are stored highest-impact first; a query reads at most this many
+# entries per term, which bounds latency for very common terms on large corpora
+MAX_POSTINGS_PER_TERM = 1000
+
+# Queries reading at least this many postings are scored with NumPy
+VECTORIZE_MIN_POSTINGS = 256
+
+# Terms whose postings are kept as NumPy arrays; the cache is cleared when full
+ARRAY_CACHE_TERMS = 4096
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words with these endings are singular ('bonus', 'analysis', 'access')
+_SINGULAR_ENDINGS = ('ss', 'us', 'is')
+
+# Plurals of words with these endings add -es ('bonuses', 'taxes', 'matches')
+_SIBILANT_ENDINGS = ('ss', 'us', 'is', 'x', 'z', 'ch', 'sh')
+
+
+def normalize_token(token):
+    """Plural folding so 'tickets'/'ticket', 'policies'/'policy' and
+    'bonuses'/'bonus' share a posting. Singular words ending in s ('bonus',
+    'status', 'analysis', 'access') are left alone."""
+    if len(token) <= 3 or not token.endswith('s') or token.endswith(_SINGULAR_ENDINGS):
+        return token
+    if token.endswith('ies') and len(token) > 4:
+        return token[:-3] + 'y'
+    if token.endswith('es') and token[:-2].endswith(_SIBILANT_ENDINGS):
+        return token[:-2]
+    return token[:-1]
+
+
+def tokenize(text):
+    """Split text into normalized index terms, dropping stopwords."""
+    return [normalize_token(t) for t in _TOKEN_RE.findall(text.lower())
+            if t not in STOPWORDS]
+
+
+def build_synonym_tables(keyword_mapping):
+    """Precompute term and phrase expansions from the keyword mapping.
+
+    Returns (term_expansions, phrase_expansions) where term_expansions maps a
+    single normalized term to its synonym terms and phrase_expansions is a list
+    of (lowercase phrase, synonym terms) checked against the raw query.
+    """
+    term_expansions = {}
+    phrase_expansions = []
+
+    for key, synonyms in keyword_mapping.items():
+        synonym_terms = []
+        for synonym in synonyms:
+            synonym_terms.extend(tokenize(synonym))
+
+        key_terms = tokenize(key)
+        for term in key_terms:
+            term_expansions.setdefault(term, set()).update(synonym_terms)
+        if len(key.split()) > 1:
+            phrase_expansions.append((key, tuple(synonym_terms)))
+
+    term_expansions = {term: tuple(sorted(syns)) for term, syns in term_expansions.items()}
+    return term_expansions, phrase_expansions
+
+
+def analyze_document(doc_id, doc):
+    """Return (term frequencies, metadata terms, length) for one document."""
+    tf = {}
+    for term in tokenize(doc['content']):
+        tf[term] = tf.get(term, 0) + 1
+    meta = set(tokenize(doc['category'])) | set(tokenize(doc_id.replace('_', ' ')))
+    return tf, meta, sum(tf.values())
+
+
+_REMOVED = object()
+
+
+class LayeredDict:
+    """Dict that copies in time proportional to its recent changes.
+
+    A copy shares the base dict, which is never modified, and keeps its own
+    changes in a small layer on top. Once the layer outgrows about the
+    square root of the base, the next copy flattens both into a new base,
+    so copies stay cheap on average without layers piling up. Indexes
+    derived by SearchIndex.updated() share all untouched entries this way.
+    """
+
+    # Flatten when len(layer) ** 2 exceeds this many times len(base)
+    FLATTEN_FACTOR = 64
+
+    def __init__(self, base=None):
+        self._base = {} if base is None else base
+        self._layer = {}
+        self._len = len(self._base)
+
+    @classmethod
+    def copy_of(cls, mapping):
+        """A LayeredDict with mapping's contents; a plain dict becomes its shared base."""
+        if isinstance(mapping, LayeredDict):
+            return mapping.copy()
+        return cls(mapping)
+
+    def copy(self):
+        if len(self._layer) ** 2 > self.FLATTEN_FACTOR * max(len(self._base), 1):
+            return LayeredDict(dict(self.items()))
+        clone = LayeredDict(self._base)
+        clone._layer = dict(self._layer)
+        clone._len = self._len
+        return clone
+
+    def get(self, key, default=None):
+        value = self._layer.get(key, _REMOVED)
+        if value is _REMOVED:
+            if key in self._layer:
+                return default
+            return self._base.get(key, default)
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _REMOVED)
+        if value is _REMOVED:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _REMOVED) is not _REMOVED
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._len += 1
+        self._layer[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._len -= 1
+        if key in self._base:
+            self._layer[key] = _REMOVED
+        else:
+            del self._layer[key]
+
+    def pop(self, key, default=None):
+        value = self.get(key, _REMOVED)
+        if value is _REMOVED:
+            return default
+        del self[key]
+        return value
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for key in self._base:
+            if key not in self._layer:
+                yield key
+        for key, value in self._layer.items():
+            if value is not _REMOVED:
+                yield key
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        layer = self._layer
+        for key, value in self._base.items():
+            if key not in layer:
+                yield key, value
+        for key, value in layer.items():
+            if value is not _REMOVED:
+                yield key, value
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+
+class CorpusStats:
+    """Document count, total length and document frequencies behind BM25 weights."""
+
+    def __init__(self, total_docs=0, total_length=0, doc_freq=None):
+        self.total_docs = total_docs
+        self.total_length = total_length
+        self.doc_freq = {} if doc_freq is None else doc_freq
+
+    @classmethod
+    def from_analyses(cls, analyses):
+        stats = cls()
+        for analysis in analyses:
+            if analysis is not None:
+                stats.add(analysis)
+        return stats
+
+    def copy(self):
+        return CorpusStats(self.total_docs, self.total_length, LayeredDict.copy_of(self.doc_freq))
+
+    def add(self, analysis, sign=1):
+        tf, meta, length = analysis
+        self.total_docs += sign
+        self.total_length += sign * length
+        for term in set(tf) | meta:
+            df = self.doc_freq.get(term, 0) + sign
+            if df:
+                self.doc_freq[term] = df
+            else:
+                del self.doc_freq[term]
+
+    def remove(self, analysis):
+        self.add(analysis, -1)
+
+    @property
+    def avg_length(self):
+        return self.total_length / self.total_docs if self.total_docs else 0.0
+
+    def idf(self, term):
+        df = self.doc_freq.get(term, 0)
+        return math.log(1 + (self.total_docs - df + 0.5) / (df + 0.5))
+
+    def impact(self, term, analysis):
+        """BM25 weight of term in an analyzed document, plus the metadata boost."""
+        tf, meta, length = analysis
+        avg_length = self.avg_length
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) if avg_length else BM25_K1
+        idf = self.idf(term)
+        freq = tf.get(term, 0)
+        impact = idf * freq * (BM25_K1 + 1) / (freq + norm) if freq else 0.0
+        if term in meta:
+            impact += META_BOOST * idf
+        return impact
+
+
+def _ordered_postings(entries):
+    """(impact, doc_index) pairs -> (doc_indexes, impacts) arrays, best first."""
+    entries.sort(reverse=True)
+    return (
+        array('I', [doc_index for _, doc_index in entries]),
+        array('d', [impact for impact, _ in entries])
+    )
+
+
+def _insertion_point(impacts, impact):
+    """Index at which impact keeps a highest-first impacts sequence ordered."""
+    low, high = 0, len(impacts)
+    while low < high:
+        mid = (low + high) // 2
+        if impacts[mid] >= impact:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def build_postings(analyses, stats):
+    """Precompute per-posting BM25 impacts for every analyzed document.
+
+    Returns {term: (doc_indexes, impacts)} with each term's postings ordered
+    highest impact first; doc indexes are positions in analyses.
+    """
+    postings = {}
+    for doc_index, analysis in enumerate(analyses):
+        if analysis is None:
+            continue
+        tf, meta, _ = analysis
+        for term in set(tf) | meta:
+            postings.setdefault(term, []).append((stats.impact(term, analysis), doc_index))
+
+    return {term: _ordered_postings(entries) for term, entries in postings.items()}
+
+
+class SearchIndex:
+    """BM25 inverted index over knowledge base documents.
+
+    postings maps each term to (doc_indexes, impacts) sequences; they can be
+    arrays built in memory or views over a prebuilt on-disk index.
+    Indexes built in memory also keep each document's analysis, so updated()
+    can derive a new index without re-tokenizing unchanged documents.
+    """
+
+    # Fraction of the corpus that may change (or of slots left empty by
+    # removals) before updated() falls back to a full rebuild
+    REBUILD_DRIFT = 0.25
+
+    def __init__(self, doc_ids, documents, postings, keyword_mapping=None,
+                 analyses=None, stats=None, built_docs=None, changes=0, positions=None, scales=None):
+        self.doc_ids = doc_ids
+        self.documents = documents
+        self.postings = postings
+        self.positions = positions  # {doc_id: doc_index} of live documents, for updated()
+        self.scales = {} if scales is None else scales  # term -> factor its stored impacts are scaled by
+        self.keyword_mapping = keyword_mapping
+        self.analyses = analyses
+        self.stats = stats
+        self.built_docs = built_docs  # Document count when the index was last fully built
+        self.changes = changes  # Documents touched by incremental updates since then
+        self.term_expansions, self.phrase_expansions = build_synonym_tables(
+            KEYWORD_MAPPING if keyword_mapping is None else keyword_mapping
+        )
+        self._arrays = {}  # term -> capped postings as NumPy arrays
+
+    @classmethod
+    def build(cls, documents, keyword_mapping=None):
+        """Build an index from a {doc_id: doc} mapping."""
+        doc_ids = list(documents.keys())
+        analyses = [analyze_document(doc_id, documents[doc_id]) for doc_id in doc_ids]
+        stats = CorpusStats.from_analyses(analyses)
+        return cls(doc_ids, documents, build_postings(analyses, stats), keyword_mapping,
+                   analyses, stats, len(doc_ids), positions={doc_id: i for i, doc_id in enumerate(doc_ids)})
+
+    def updated(self, upserts, deletions=()):
+        """Return a new index with documents added, replaced or removed.
+
+        Only the postings of terms that occur in the touched documents are
+        rewritten; everything else, including the document map, is shared
+        with this index through LayeredDicts. Other terms keep impacts from
+        the previous corpus statistics until enough of the corpus has
+        changed to warrant a full rebuild. This index is left untouched, so
+        searches running against it are unaffected.
+        """
+        if self.analyses is None:
+            raise TypeError("Prebuilt indexes cannot be updated; rebuild the document store")
+
+        documents = LayeredDict.copy_of(self.documents)
+        for doc_id in deletions:
+            documents.pop(doc_id, None)
+        documents.update(upserts)
+
+        positions = LayeredDict.copy_of(self.positions)
+        slots = len(self.doc_ids) + sum(1 for doc_id in upserts if doc_id not in positions)
+        changes = self.changes + len(upserts) + len(deletions)
+        drift = max(changes, abs(len(documents) - self.built_docs))
+        if (drift > self.REBUILD_DRIFT * max(self.built_docs, 1)
+                or slots - len(documents) > self.REBUILD_DRIFT * max(slots, 1)):
+            live_ids = [doc_id for doc_id in self.doc_ids if doc_id in documents]
+            live_ids += [doc_id for doc_id in upserts if doc_id not in positions]
+            return self.build({doc_id: documents[doc_id] for doc_id in live_ids}, self.keyword_mapping)
+
+        doc_ids = list(self.doc_ids)
+        analyses = list(self.analyses)
+        stats = self.stats.copy()
+        affected = set()
+        touched = []
+        cleared = []  # Positions whose previous postings must go
+
+        for doc_id in list(deletions) + list(upserts):
+            position = positions.get(doc_id)
+            if position is not None and analyses[position] is not None:
+                tf, meta, _ = analyses[position]
+                affected |= set(tf) | meta
+                stats.remove(analyses[position])
+                analyses[position] = None
+                cleared.append(position)
+                if doc_id not in upserts:
+                    doc_ids[position] = None  # Removed; the slot stays empty
+                    del positions[doc_id]
+
+        for doc_id, doc in upserts.items():
+            position = positions.get(doc_id)
+            if position is None:
+                position = positions[doc_id] = len(doc_ids)
+                doc_ids.append(doc_id)
+                analyses.append(None)
+            analyses[position] = analyze_document(doc_id, doc)
+            stats.add(analyses[position])
+            tf, meta, _ = analyses[position]
+            affected |= set(tf) | meta
+            touched.append(position)
+
+        # Impacts are linear in idf, so when a term's document frequency
+        # changes, other documents' postings are rescaled through the term's
+        # scale factor rather than rewritten; the touched documents are
+        # spliced in or out, stored relative to that factor
+        postings = LayeredDict.copy_of(self.postings)
+        scales = LayeredDict.copy_of(self.scales)
+        for term in affected:
+            doc_indexes, impacts = self.postings.get(term) or (array('I'), array('d'))
+            if cleared and doc_indexes:
+                docs = np.asarray(doc_indexes)
+                drop = docs == cleared[0] if len(cleared) == 1 else np.isin(docs, cleared)
+                if drop.any():
+                    doc_indexes = array('I', docs[~drop].tobytes())
+                    impacts = array('d', np.asarray(impacts)[~drop].tobytes())
+            scale = self.scales.get(term, 1.0) if impacts else 1.0
+            if impacts and term in stats.doc_freq:
+                scale *= stats.idf(term) / self.stats.idf(term)
+
+            for doc_index in touched:
+                analysis = analyses[doc_index]
+                if term in analysis[0] or term in analysis[1]:
+                    impact = stats.impact(term, analysis) / scale
+                    i = _insertion_point(impacts, impact)
+                    doc_indexes = doc_indexes[:i] + array('I', [doc_index]) + doc_indexes[i:]
+                    impacts = impacts[:i] + array('d', [impact]) + impacts[i:]
+
+            if doc_indexes:
+                postings[term] = (doc_indexes, impacts)
+            else:
+                postings.pop(term, None)
+            if doc_indexes and scale != 1.0:
+                scales[term] = scale
+            else:
+                scales.pop(term, None)
+
+        return SearchIndex(doc_ids, documents, postings, self.keyword_mapping,
+                           analyses, stats, self.built_docs, changes, positions, scales)
+
+    def document(self, doc_index):
+        """Return (doc_id, doc) for a position in the index."""
+        doc_id = self.doc_ids[doc_index]
+        return doc_id, self.documents[doc_id]
+
+    def expand_query(self, query):
+        """Return {term: weight} for the query plus its synonym expansions."""
+        query_lower = query.lower()
+        weights = {}
+
+        for term in tokenize(query_lower):
+            weights[term] = 1.0
+
+        expansions = []
+        for term in list(weights):
+            expansions.extend(self.term_expansions.get(term, ()))
+        for phrase, synonym_terms in self.phrase_expansions:
+            if phrase in query_lower:
+                expansions.extend(synonym_terms)
+
+        for term in expansions:
+            if weights.get(term, 0.0) < SYNONYM_WEIGHT:
+                weights[term] = SYNONYM_WEIGHT
+
+        return weights
+
+    def rank(self, query, k=3):
+        """Return [(doc_index, score)] for the top-k matching documents, best first."""
+        matched = []
+        scales = self.scales
+        for term, weight in self.expand_query(query).items():
+            posting = self.postings.get(term)
+            if posting is not None:
+                matched.append((term, posting, weight * scales.get(term, 1.0)))
+        if sum(min(len(posting[0]), MAX_POSTINGS_PER_TERM) for _, posting, _ in matched) >= VECTORIZE_MIN_POSTINGS:
+            return self.rank_vectorized(matched, k)
+
+        scores = {}
+        get_score = scores.get
+        for _, posting, weight in matched:
+            doc_indexes, impacts = posting
+            for doc_index, impact in zip(doc_indexes[:MAX_POSTINGS_PER_TERM],
+                                         impacts[:MAX_POSTINGS_PER_TERM]):
+                scores[doc_index] = get_score(doc_index, 0.0) + weight * impact
+
+        top = heapq.nlargest(k, scores.items(), key=itemgetter(1))
+        return [(doc_index, score) for doc_index, score in top if score > 0]
+
+    def rank_vectorized(self, matched, k):
+        """rank() for [(term, posting, weight)] as a NumPy scatter-add."""
+        arrays = [self.posting_arrays(term, posting) for term, posting, _ in matched]
+        doc_indexes = np.concatenate([docs for docs, _ in arrays])
+        impacts = np.concatenate([impacts * weight for (_, impacts), (_, _, weight) in zip(arrays, matched)])
+        candidates, slots = np.unique(doc_indexes, return_inverse=True)
+        scores = np.bincount(slots, weights=impacts)
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+        else:
+            top = np.argsort(-scores, kind='stable')
+        return [(int(candidates[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def posting_arrays(self, term, posting):
+        """A term's postings, capped at MAX_POSTINGS_PER_TERM, as NumPy arrays."""
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            if len(self._arrays) >= ARRAY_CACHE_TERMS:
+                self._arrays = {}
+            doc_indexes, impacts = posting
+            arrays = (np.asarray(doc_indexes[:MAX_POSTINGS_PER_TERM], dtype=np.int64),
+                      np.asarray(impacts[:MAX_POSTINGS_PER_TERM], dtype=np.float64))
+            self._arrays[term] = arrays
+        return arrays
+
+    def results(self, ranked):
+        """Turn [(doc_index, score)] into search result dicts."""
+        results = []
+        for doc_index, score in ranked:
+            doc_id, doc = self.document(doc_index)
+            results.append({
+                "id": doc_id,
+                "content": doc['content'],
+                "source": doc['source'],
+                "category": doc['category'],
+                "score": round(float(score), 4)
+            })
+        return results
+
+    def search(self, query, k=3):
+        """Return the top-k documents for the query, best first."""
+        return self.results(self.rank(query, k))
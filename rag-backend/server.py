@@ -0,0 +1,165 @@
+"""
+Qbit RAG Backend - HTTP Server
+Concurrent serving for OllamaRAGHandler.
+
+Every client connection gets its own lightweight thread, so cheap endpoints
+such as /health are answered immediately. Slow, LLM-bound routes are handed to
+a bounded worker pool; when it is full they wait their turn without holding up
+anyone else. Connections are kept alive between requests, but an idle one
+gives up its slot when a new connection would otherwise be turned away;
+shutdown stops accepting connections, closes the idle ones and drains
+in-flight requests before the process exits.
+"""
+
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+# Seconds a new connection waits for a closed idle connection's slot
+IDLE_EVICTION_WAIT = 1.0
+
+
+class QbitHTTPServer(ThreadingHTTPServer):
+    """Thread-per-connection HTTP server with a bounded pool for slow work."""
+
+    # Connection threads never keep the process alive; drain() waits for them
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, server_address, handler_class, workers=8, max_connections=256, backlog=128):
+        # Bursts of new connections queue in the kernel instead of being refused
+        self.request_queue_size = backlog
+        super().__init__(server_address, handler_class)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qbit-worker')
+        self._connection_slots = threading.BoundedSemaphore(max_connections)
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self._waiting = {}  # Kept-alive connections waiting for their next request, longest idle first
+        self._draining = False
+
+    def process_request(self, request, client_address):
+        """Start a connection thread, or reject when draining or at capacity.
+
+        At capacity, an idle keep-alive connection is closed to make room, so
+        a pool of idle clients can't lock out new ones (e.g. health probes).
+        """
+        if self._draining or not (self._connection_slots.acquire(blocking=False)
+                                  or (self._close_idle_connection()
+                                      and self._connection_slots.acquire(timeout=IDLE_EVICTION_WAIT))):
+            self._reject(request)
+            return
+
+        with self._idle:
+            self._in_flight += 1
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._release_connection()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        """Serve one connection, then give back its slot."""
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connection_waiting(request, False)
+            self._release_connection()
+
+    def _release_connection(self):
+        self._connection_slots.release()
+        with self._idle:
+            self._in_flight -= 1
+            self._idle.notify_all()
+
+    def _reject(self, request):
+        """Answer 503 without parsing the request and close the connection."""
+        body = json.dumps({"error": "Server busy, please retry"}).encode()
+        head = (
+            "HTTP/1.0 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Retry-After: 1\r\n"
+            "Connection: close\r\n"
+            "Access-Control-Allow-Origin: *\r\n"
+            "\r\n"
+        ).encode()
+        try:
+            request.sendall(head + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def connection_waiting(self, connection, waiting):
+        """Track whether a connection is idle between requests.
+
+        Returns False when the server is draining and the connection should
+        close instead of waiting for another request.
+        """
+        with self._idle:
+            if not waiting:
+                self._waiting.pop(connection, None)
+            elif self._draining:
+                return False
+            else:
+                self._waiting[connection] = None
+        return True
+
+    def _close_idle_connection(self):
+        """Shut down the longest-idle keep-alive connection, which frees its
+        slot once its thread sees end-of-stream; False if none is idle."""
+        with self._idle:
+            connection = next(iter(self._waiting), None)
+            if connection is None:
+                return False
+            del self._waiting[connection]
+        try:
+            connection.shutdown(socket.SHUT_RD)
+        except OSError:
+            pass
+        return True
+
+    def run_in_worker(self, func, *args):
+        """Run func on the worker pool and wait for its result."""
+        return self.submit_to_worker(func, *args).result()
+
+    def submit_to_worker(self, func, *args):
+        """Queue func on the worker pool; returns its Future."""
+        return self.executor.submit(func, *args)
+
+    @property
+    def draining(self):
+        return self._draining
+
+    @property
+    def in_flight(self):
+        """Number of connections currently being served."""
+        return self._in_flight
+
+    def drain(self, timeout):
+        """Stop taking new connections and wait for in-flight ones to finish.
+
+        Returns the number of connections still open when the timeout expired.
+        """
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            self._draining = True
+            # Idle keep-alive connections see end-of-stream and close now
+            for connection in self._waiting:
+                try:
+                    connection.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+            self._waiting.clear()
+            while self._in_flight > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+            still_open = self._in_flight
+
+        self.executor.shutdown(wait=still_open == 0)
+        return still_open
@@ -0,0 +1,247 @@
+"""
+Qbit RAG Backend - Conversation Sessions
+Per-conversation memory so follow-up questions don't re-send everything.
+
+A session is keyed by the conversation_id the client sends back with each
+chat. It keeps a short, compacted history of the last few turns and the
+Ollama `context` tokens returned by /api/generate. A follow-up turn passes
+those tokens back, so Ollama only has to prefill the new question and any
+documents the conversation hasn't seen yet instead of the whole prompt.
+When the tokens are missing (a cached or extractive answer, an aborted
+stream, a knowledge reload, a context grown past its budget) the compact
+history is written into the prompt instead.
+
+Sessions are evicted least recently used first, after a TTL of inactivity,
+and whenever the store exceeds its entry count or approximate byte budget.
+"""
+
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict, deque
+
+import config
+
+# Rough per-session bookkeeping cost on top of the history text and tokens
+_SESSION_OVERHEAD = 512
+
+# Longest conversation_id accepted from a client
+MAX_ID_LENGTH = 128
+
+# History is kept as a gist of each turn, not the full text
+MAX_QUESTION_CHARS = 300
+MAX_ANSWER_CHARS = 400
+
+
+def compact(text, limit):
+    """Collapse whitespace and cut text to about limit characters at a word boundary."""
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0] + " …"
+
+
+def conversation_id_from(request_data):
+    """The client's conversation_id if it is usable, else a new one."""
+    conversation_id = request_data.get('conversation_id')
+    if isinstance(conversation_id, str) and 0 < len(conversation_id) <= MAX_ID_LENGTH:
+        return conversation_id
+    return str(uuid.uuid4())
+
+
+class Turn:
+    """One compacted question and answer."""
+
+    __slots__ = ('question', 'answer', 'in_context')
+
+    def __init__(self, question, answer, in_context):
+        self.question = compact(question, MAX_QUESTION_CHARS)
+        self.answer = compact(answer, MAX_ANSWER_CHARS)
+        self.in_context = in_context  # Already part of the session's Ollama context tokens
+
+    @property
+    def size(self):
+        return len(self.question) + len(self.answer)
+
+
+class SessionState:
+    """What a new turn needs from its session, copied out under the store lock."""
+
+    def __init__(self, conversation_id, context=None, turns=(), context_docs=frozenset(), generation=0,
+                 host=None):
+        self.conversation_id = conversation_id
+        self.context = context  # Ollama context tokens to pass back, or None
+        self.host = host  # Ollama server that produced the context, likely still holding its cache
+        self.turns = turns  # (question, answer) pairs the context doesn't hold yet
+        self.context_docs = context_docs  # Document ids the context already holds
+        self.generation = generation
+
+    @property
+    def has_history(self):
+        return self.context is not None or bool(self.turns)
+
+
+class Session:
+    """History and Ollama context of one conversation."""
+
+    def __init__(self, conversation_id, max_turns):
+        self.conversation_id = conversation_id
+        self.turns = deque(maxlen=max_turns)
+        self.context = None  # array('I') of Ollama context tokens
+        self.context_model = None
+        self.context_host = None
+        self.context_docs = frozenset()  # Document ids already written into the context
+        self.generation = 0  # Bumped whenever the context changes
+        self.expires_at = 0.0
+        self.size = _SESSION_OVERHEAD
+
+    def state(self, model):
+        if self.context is not None and self.context_model == model:
+            return SessionState(self.conversation_id, self.context.tolist(),
+                                [(turn.question, turn.answer) for turn in self.turns if not turn.in_context],
+                                self.context_docs, self.generation, self.context_host)
+        return SessionState(self.conversation_id, None,
+                            [(turn.question, turn.answer) for turn in self.turns],
+                            generation=self.generation)
+
+    def measure(self):
+        self.size = (_SESSION_OVERHEAD + sum(turn.size for turn in self.turns)
+                     + (self.context.itemsize * len(self.context) if self.context is not None else 0))
+
+    def drop_context(self):
+        self.context = None
+        self.context_model = None
+        self.context_host = None
+        self.context_docs = frozenset()
+        self.generation += 1
+        for turn in self.turns:
+            turn.in_context = False
+
+
+class SessionStore:
+    """Thread-safe LRU store of sessions with a TTL and memory bound."""
+
+    def __init__(self, max_sessions=10000, ttl=1800.0, max_bytes=32 * 1024 * 1024,
+                 max_turns=6, max_context_tokens=1536):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.max_context_tokens = max_context_tokens
+        self._sessions = OrderedDict()  # conversation_id -> Session
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.resumed = 0
+        self.started = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_sessions > 0
+
+    def begin(self, conversation_id, model):
+        """Return the SessionState a new turn of conversation_id builds on.
+
+        Unknown and expired conversations start empty under the same id.
+        """
+        if not self.enabled:
+            return SessionState(conversation_id)
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None and session.expires_at <= now:
+                self._remove(conversation_id)
+                session = None
+            if session is None:
+                self.started += 1
+                return SessionState(conversation_id)
+            self._sessions.move_to_end(conversation_id)
+            self.resumed += 1
+            return session.state(model)
+
+    def record(self, conversation_id, question, answer, base_generation=None,
+               context=None, model=None, docs=(), host=None):
+        """Add a finished turn to a conversation, creating its session if needed.
+
+        context is the token list Ollama returned for a turn whose prompt was
+        built on base_generation of the session; it replaces the session's
+        context only if no other turn changed it in the meantime.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            session = self._sessions.pop(conversation_id, None)
+            if session is None:
+                session = Session(conversation_id, self.max_turns)
+            else:
+                self._bytes -= session.size
+
+            fresh = (context is not None and session.generation == base_generation
+                     and len(context) <= self.max_context_tokens)
+            if fresh:
+                # The new context holds every earlier turn plus this one
+                known_docs = session.context_docs if session.context_model == model else frozenset()
+                session.context = array('I', context)
+                session.context_model = model
+                session.context_host = host
+                session.context_docs = known_docs | frozenset(doc['id'] for doc in docs)
+                session.generation += 1
+                for turn in session.turns:
+                    turn.in_context = True
+            elif context is not None and len(context) > self.max_context_tokens:
+                session.drop_context()
+            session.turns.append(Turn(question, answer, fresh))
+            session.expires_at = time.monotonic() + self.ttl
+            session.measure()
+
+            self._sessions[conversation_id] = session
+            self._bytes += session.size
+            while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._sessions)))
+                self.evictions += 1
+
+    def invalidate_documents(self, doc_ids):
+        """Drop the Ollama context of sessions whose context holds stale documents.
+
+        doc_ids=None drops every context. History is kept; the next turn is
+        prompted with it instead.
+        """
+        with self._lock:
+            dropped = 0
+            for session in self._sessions.values():
+                if session.context is None:
+                    continue
+                if doc_ids is None or not session.context_docs.isdisjoint(doc_ids):
+                    self._bytes -= session.size
+                    session.drop_context()
+                    session.measure()
+                    self._bytes += session.size
+                    dropped += 1
+        return dropped
+
+    def _remove(self, conversation_id):
+        session = self._sessions.pop(conversation_id)
+        self._bytes -= session.size
+
+    def stats(self):
+        """Session counts and current size."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "started": self.started,
+                "resumed": self.resumed,
+                "evictions": self.evictions
+            }
+
+
+def create_session_store():
+    """Build the session store from config (max_sessions=0 disables sessions)."""
+    return SessionStore(
+        max_sessions=config.SESSION_MAX_SESSIONS,
+        ttl=config.SESSION_TTL,
+        max_bytes=config.SESSION_MAX_BYTES,
+        max_turns=config.SESSION_MAX_TURNS,
+        max_context_tokens=config.SESSION_MAX_CONTEXT_TOKENS
+    )